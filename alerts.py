@@ -0,0 +1,236 @@
+"""Price alert engine.
+
+Alert thresholds are indexed per symbol and direction in sorted lists.  A
+price update only visits the thresholds between the previous and the new
+price, found with bisect, so the cost of a tick does not grow with the
+number of alerts that are not crossed.
+
+An alert fires once when the price crosses its threshold and stays active
+until the price moves back past the threshold by the hysteresis percent,
+which re-arms it.  Alerts with the same symbol, direction and price are
+kept once and remember every owner that asked for them.
+
+The last prices and which alerts are active can be saved to a state file,
+so hysteresis and firing once also hold across separate runs.
+"""
+import bisect
+import json
+import os
+
+ABOVE = '^'
+BELOW = 'v'
+
+DEFAULT_STATE_FILE = os.path.join(os.path.expanduser('~'),
+                                  'pricer_alert_state.json')
+
+
+class Alert:
+    """A price threshold for a symbol."""
+
+    __slots__ = ('symbol', 'direction', 'price', 'owners', 'active')
+
+    def __init__(self, symbol, direction, price):
+        self.symbol = symbol
+        self.direction = direction
+        self.price = price
+        self.owners = []
+        self.active = False
+
+    def __repr__(self):
+        return 'Alert({!r}, {!r}, {!r})'.format(self.symbol, self.direction,
+                                                self.price)
+
+
+class Thresholds:
+    """The alerts of one symbol and direction ordered by price."""
+
+    __slots__ = ('prices', 'alerts')
+
+    def __init__(self):
+        self.prices = []
+        self.alerts = []
+
+    def add(self, alert):
+        index = bisect.bisect_right(self.prices, alert.price)
+        self.prices.insert(index, alert.price)
+        self.alerts.insert(index, alert)
+
+
+class AlertEngine:
+    """Sorted price thresholds for many symbols.
+
+       hysteresis is the percent the price has to move back past a
+       threshold before its alert can fire again."""
+
+    def __init__(self, hysteresis=0.0):
+        self.hysteresis = hysteresis
+        # (symbol, direction) -> Thresholds
+        self.thresholds = {}
+        # (symbol, direction, price) -> Alert
+        self.alerts = {}
+        # owner -> alerts
+        self.owned = {}
+        # symbol -> last price
+        self.last = {}
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def add(self, symbol, direction, price, owner=None):
+        """Add an alert, returning the existing one if it is a duplicate."""
+        key = (symbol, direction, price)
+        alert = self.alerts.get(key)
+        if alert is None:
+            alert = self.alerts[key] = Alert(symbol, direction, price)
+            thresholds = self.thresholds.get((symbol, direction))
+            if thresholds is None:
+                thresholds = self.thresholds[(symbol, direction)] = \
+                    Thresholds()
+            thresholds.add(alert)
+
+        if owner is not None:
+            alert.owners.append(owner)
+            self.owned.setdefault(owner, []).append(alert)
+
+        return alert
+
+    def update(self, symbol, price):
+        """Set a symbol's price, returning the alerts that fired."""
+        previous = self.last.get(symbol)
+        self.last[symbol] = price
+        fired = []
+        factor = self.hysteresis / 100
+
+        above = self.thresholds.get((symbol, ABOVE))
+        if above is not None:
+            prices = above.prices
+            if previous is None or price > previous:
+                # fire the thresholds in [previous, price)
+                start = 0
+                if previous is not None:
+                    start = bisect.bisect_left(prices, previous)
+                end = bisect.bisect_left(prices, price)
+                fired.extend(self.fire(above.alerts, start, end))
+            elif price < previous:
+                # re-arm the thresholds with t * (1 - h) in [price, previous)
+                self.rearm(above.alerts,
+                           bisect.bisect_left(prices, price / (1 - factor)),
+                           bisect.bisect_left(prices,
+                                              previous / (1 - factor)))
+
+        below = self.thresholds.get((symbol, BELOW))
+        if below is not None:
+            prices = below.prices
+            if previous is None or price < previous:
+                # fire the thresholds in (price, previous]
+                end = len(prices)
+                if previous is not None:
+                    end = bisect.bisect_right(prices, previous)
+                start = bisect.bisect_right(prices, price)
+                fired.extend(self.fire(below.alerts, start, end))
+            elif price > previous:
+                # re-arm the thresholds with t * (1 + h) in (previous, price]
+                self.rearm(below.alerts,
+                           bisect.bisect_right(prices,
+                                               previous / (1 + factor)),
+                           bisect.bisect_right(prices, price / (1 + factor)))
+
+        return fired
+
+    @staticmethod
+    def fire(alerts, start, end):
+        fired = []
+        for alert in alerts[start:end]:
+            if not alert.active:
+                alert.active = True
+                fired.append(alert)
+
+        return fired
+
+    @staticmethod
+    def rearm(alerts, start, end):
+        for alert in alerts[start:end]:
+            alert.active = False
+
+    def forget(self, symbol):
+        """Forget a symbol's last price, so its next price is taken as the
+           first."""
+        self.last.pop(symbol, None)
+
+    def get_active(self, owner):
+        """Get an owner's active alerts."""
+        return [x for x in self.owned.get(owner, []) if x.active]
+
+    def get_state(self):
+        """Get the last price and alerts of each symbol with alerts, for
+           set_state() in a later run."""
+        state = {}
+        for alert in self.alerts.values():
+            entry = state.get(alert.symbol)
+            if entry is None:
+                entry = state[alert.symbol] = {
+                    'last': self.last.get(alert.symbol),
+                    'alerts': [],
+                }
+            entry['alerts'].append([alert.direction, alert.price,
+                                    alert.active])
+
+        return state
+
+    def set_state(self, state):
+        """Carry on from the get_state() of an earlier run.
+
+           An alert the earlier run did not have is active if the last
+           price is already past it, as if it had been there all along."""
+        symbols = {x.symbol for x in self.alerts.values()}
+        for symbol, entry in state.items():
+            if symbol not in symbols or entry.get('last') is None:
+                continue
+            last = self.last[symbol] = entry['last']
+            known = {(direction, price): active
+                     for direction, price, active in entry.get('alerts', [])}
+            for direction in [ABOVE, BELOW]:
+                thresholds = self.thresholds.get((symbol, direction))
+                if thresholds is None:
+                    continue
+                for alert in thresholds.alerts:
+                    active = known.get((direction, alert.price))
+                    if active is None:
+                        if direction == ABOVE:
+                            active = last > alert.price
+                        else:
+                            active = last < alert.price
+                    alert.active = active
+
+
+def read_state(filename=DEFAULT_STATE_FILE):
+    """Read a saved alert state, empty if there is none."""
+    try:
+        with open(filename) as fp:
+            state = json.load(fp)
+    except (IOError, ValueError):
+        return {}
+
+    return state if isinstance(state, dict) else {}
+
+
+def write_state(state, filename=DEFAULT_STATE_FILE):
+    """Atomically write an alert state."""
+    tmp_filename = '{}.tmp'.format(filename)
+    with open(tmp_filename, 'w') as fp:
+        json.dump(state, fp)
+    os.replace(tmp_filename, filename)
+
+
+def add_holding_alerts(engine, symbol, item, owner=None):
+    """Add the price_above and price_below alerts of a shares file holding.
+
+       Hidden alerts are left out."""
+    alert = item.get('alert') or {}
+    if alert.get('hide', False):
+        return
+
+    if alert.get('price_above') is not None:
+        engine.add(symbol, ABOVE, alert['price_above'], owner=owner)
+    if alert.get('price_below') is not None:
+        engine.add(symbol, BELOW, alert['price_below'], owner=owner)
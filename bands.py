@@ -0,0 +1,173 @@
+#! /usr/bin/env python3
+"""Up and down price bands.
+
+A band ladder is a list of percent steps above and below a base price, such
+as the +2%/-1% band of bands.sh or the +/- swing of percentage.sh.  The
+base is either a symbol's current price or a lot's cost.
+"""
+import argparse
+import decimal
+
+from render import Column, RowFormat
+
+DEFAULT_UP = [2.0]
+DEFAULT_DOWN = [1.0]
+BAND_BASES = ['price', 'cost']
+# digits after the point dc keeps ("4k"), as the old scripts set it
+DC_SCALE = 4
+
+
+def parse_steps(value):
+    """Parse comma separated percent steps."""
+    try:
+        return [float(x) for x in value.split(',') if x.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "invalid percent steps '{}'".format(value))
+
+
+class Bands:
+    """A ladder of percent steps up and down from a base price."""
+
+    def __init__(self, up=DEFAULT_UP, down=DEFAULT_DOWN, base='price',
+                 precision=2):
+        self.up = sorted(up)
+        self.down = sorted(down)
+        self.base = base
+        self.up_factors = [1 + x / 100 for x in self.up]
+        self.down_factors = [1 - x / 100 for x in self.down]
+        self.up_format = RowFormat([
+            Column(precision=precision) for _ in self.up])
+        self.down_format = RowFormat([
+            Column(precision=precision) for _ in self.down])
+
+    def get_ladder(self, price):
+        """Get the up and down prices for a base price."""
+        return ([price * x for x in self.up_factors],
+                [price * x for x in self.down_factors])
+
+    def get_ladders(self, prices):
+        """Get the up and down prices for an array of base prices as two
+           arrays with a row per base price."""
+        import numpy as np
+
+        prices = np.asarray(prices, dtype=np.float64)[:, None]
+        return (prices * np.array(self.up_factors),
+                prices * np.array(self.down_factors))
+
+    def format(self, price, color=True):
+        """Format the ladder for a base price, ups in green and downs in
+           red."""
+        up, down = self.get_ladder(price)
+        return '{} {}'.format(
+            self.up_format.format(up, color='green' if color else ''),
+            self.down_format.format(down, color='red' if color else ''))
+
+    def get_header(self):
+        """Get column titles lined up with format()."""
+        return ' '.join(
+            ['{:>10s}'.format('+{:g}%'.format(x)) for x in self.up] +
+            ['{:>10s}'.format('-{:g}%'.format(x)) for x in self.down])
+
+
+def parse_price(value):
+    """Parse a base price, keeping its digits for --dc."""
+    try:
+        return decimal.Decimal(value)
+    except decimal.InvalidOperation:
+        raise argparse.ArgumentTypeError("invalid price '{}'".format(value))
+
+
+def get_scale(value):
+    """Get the number of digits after the point of a decimal."""
+    return max(0, -value.as_tuple().exponent)
+
+
+def truncate(value, scale):
+    return value.quantize(decimal.Decimal(1).scaleb(-scale),
+                          rounding=decimal.ROUND_DOWN)
+
+
+def dc_divide(a, b, scale=DC_SCALE):
+    """Divide like dc, truncating to scale digits."""
+    with decimal.localcontext() as context:
+        context.rounding = decimal.ROUND_DOWN
+        return truncate(a / b, scale)
+
+
+def dc_multiply(a, b, scale=DC_SCALE):
+    """Multiply like dc, which keeps the digits of both factors up to the
+       larger of scale and either factor's own and truncates the rest."""
+    a_scale = get_scale(a)
+    b_scale = get_scale(b)
+    return truncate(a * b, min(a_scale + b_scale,
+                               max(scale, a_scale, b_scale)))
+
+
+def dc_format(value):
+    """Format a decimal the way dc prints it, without a leading zero."""
+    if not value:
+        return '0'
+    text = '{:f}'.format(value)
+    if text.startswith('0.'):
+        return text[1:]
+    if text.startswith('-0.'):
+        return '-' + text[2:]
+
+    return text
+
+
+def get_dc_ladder(price, up, down, factor_scale=DC_SCALE):
+    """Get the up and down prices for a base price the way the dc scripts
+       computed them, with each factor 1 +/- step / 100 truncated to
+       factor_scale digits."""
+    one = decimal.Decimal(1)
+    hundred = decimal.Decimal(100)
+    steps = [(x, 1) for x in up] + [(x, -1) for x in down]
+    factors = [one + sign * dc_divide(decimal.Decimal(repr(x)), hundred,
+                                      factor_scale)
+               for x, sign in steps]
+    values = [dc_multiply(price, x) for x in factors]
+
+    return values[:len(up)], values[len(up):]
+
+
+def parse_args():
+    """Parse commandline options."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('prices', type=parse_price, nargs='+',
+                        help='Base prices')
+    parser.add_argument('--up', type=parse_steps, default=DEFAULT_UP,
+                        help='Comma separated percent steps up')
+    parser.add_argument('--down', type=parse_steps, default=DEFAULT_DOWN,
+                        help='Comma separated percent steps down')
+    parser.add_argument('--precision', type=int, default=4,
+                        help='Decimal places')
+    parser.add_argument('--lines', action='store_true', default=False,
+                        help='Show the up and down prices one per line')
+    parser.add_argument('--dc', action='store_true', default=False,
+                        help='Compute and print the prices exactly like '
+                             'the dc commands bands.sh and percentage.sh '
+                             'used to run')
+    parser.add_argument('--dc-factor-scale', type=int, default=DC_SCALE,
+                        help='Digits of the factors for --dc')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    bands = Bands(args.up, args.down)
+    value_format = '{{:.{}f}}'.format(args.precision)
+    for price in args.prices:
+        if args.dc:
+            up, down = get_dc_ladder(price, bands.up, bands.down,
+                                     args.dc_factor_scale)
+            values = [dc_format(x) for x in up + down]
+        else:
+            up, down = bands.get_ladder(float(price))
+            values = [value_format.format(x) for x in up + down]
+        print(('\n' if args.lines else ' ').join(values))
+
+
+if __name__ == '__main__':
+    main()
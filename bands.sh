@@ -7,4 +7,6 @@ if [ -z "$PRICE" ]; then
 	exit 1
 fi
 
-echo "4k $PRICE sp lp 1.02 * n [ ]P lp 0.99 * p" | dc
+# the old dc command multiplied by 1.02 and 0.99, factors of two digits
+exec python3 "$(dirname "$0")/bands.py" --up 2 --down 1 --dc \
+	--dc-factor-scale 2 "$PRICE"
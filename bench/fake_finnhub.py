@@ -0,0 +1,446 @@
+#! /usr/bin/env python3
+"""Local stand in for Finnhub's trade WebSocket.
+
+Speaks enough of the WebSocket protocol and of Finnhub's subscribe,
+unsubscribe, ping and trade messages to exercise fh-ws.py without the
+network.  Trades are replayed from a recorded file or generated on the fly,
+at a multiple of real time.
+
+Replayed trades are stamped with the wall clock time they are due to be
+sent, in milliseconds like Finnhub's, so a client can tell how far behind
+the stream it is.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+DEFAULT_PORT = 8766
+DEFAULT_QUEUE_SIZE = 10000  # messages per client
+DEFAULT_PING_INTERVAL = 30.0  # seconds
+
+
+def synthetic_trades(symbols, rate=1000, duration=10.0, batch=1, seed=0):
+    """Generate a random walk trade stream.
+
+       Yields (time in ms, trades) tuples, rate trades a second in messages
+       of batch trades, for duration seconds."""
+    rand = random.Random(seed)
+    prices = {x: round(rand.uniform(5.0, 500.0), 2) for x in symbols}
+    interval = 1000.0 * batch / rate
+    count = int(duration * rate / batch)
+    start = int(time.time() * 1000)
+
+    for i in range(count):
+        trades = []
+        for _ in range(batch):
+            symbol = rand.choice(symbols)
+            price = prices[symbol] * (1 + rand.gauss(0, 0.0005))
+            prices[symbol] = price = round(price, 2)
+            trades.append({'s': symbol, 'p': price,
+                           'v': rand.randint(1, 500)})
+        yield int(start + i * interval), trades
+
+
+def recorded_trades(filename):
+    """Read a recorded trade stream.
+
+       Each line is either a Finnhub trade message or a quote record as
+       written by the pricer's tick recorder.  Yields (time in ms, trades)
+       tuples."""
+    with open(filename) as fp:
+        for line in fp:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                continue
+
+            if data.get('type') == 'trade':
+                trades = data.get('data') or []
+                if trades:
+                    yield trades[0]['t'], [
+                        {'s': x['s'], 'p': x['p'], 'v': x.get('v', 0)}
+                        for x in trades
+                    ]
+            elif data.get('regularMarketPrice') is not None:
+                yield int(data.get('regularMarketTime', 0)) * 1000, [
+                    {'s': data['symbol'], 'p': data['regularMarketPrice'],
+                     'v': 0}
+                ]
+
+
+def encode_frame(payload, opcode=OP_TEXT):
+    """Encode an unmasked server frame."""
+    if isinstance(payload, str):
+        payload = payload.encode()
+
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack('!H', length)
+    else:
+        header += bytes([127]) + struct.pack('!Q', length)
+
+    return header + payload
+
+
+def read_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+
+    return data
+
+
+def read_frame(sock):
+    """Read a client frame, returning the opcode and the unmasked
+       payload."""
+    first, second = read_exact(sock, 2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', read_exact(sock, 2))
+    elif length == 127:
+        length, = struct.unpack('!Q', read_exact(sock, 8))
+
+    mask = read_exact(sock, 4) if second & 0x80 else None
+    payload = read_exact(sock, length)
+    if mask is not None:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+    return opcode, payload
+
+
+class Client:
+    """A connected client, its subscriptions and its send queue.
+
+       Messages that do not fit in the send queue are dropped and
+       counted."""
+
+    def __init__(self, sock, queue_size=DEFAULT_QUEUE_SIZE):
+        self.sock = sock
+        self.symbols = set()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.sent = 0
+        self.sent_trades = 0
+        self.queued_trades = 0
+        self.dropped = 0
+        self.dropped_trades = 0
+        self.max_queued = 0
+        self.pongs = 0
+        self.closed = False
+
+    def send(self, message, trades=0):
+        try:
+            self.queue.put_nowait((message, trades))
+        except queue.Full:
+            self.dropped += 1
+            self.dropped_trades += trades
+            return
+        self.queued_trades += trades
+        self.max_queued = max(self.max_queued, self.queue.qsize())
+
+    def write_loop(self):
+        while not self.closed:
+            message, trades = self.queue.get()
+            if message is None:
+                break
+            try:
+                self.sock.sendall(encode_frame(message))
+            except OSError:
+                break
+            self.sent += 1
+            self.sent_trades += trades
+        self.closed = True
+
+    def read_loop(self):
+        try:
+            while True:
+                opcode, payload = read_frame(self.sock)
+                if opcode == OP_CLOSE:
+                    break
+                if opcode == OP_PING:
+                    self.sock.sendall(encode_frame(payload, OP_PONG))
+                    continue
+                if opcode != OP_TEXT:
+                    continue
+
+                try:
+                    data = json.loads(payload)
+                except ValueError:
+                    continue
+                message_type = data.get('type')
+                if message_type == 'subscribe':
+                    self.symbols.add(data.get('symbol'))
+                elif message_type == 'unsubscribe':
+                    self.symbols.discard(data.get('symbol'))
+                elif message_type == 'pong':
+                    self.pongs += 1
+        except (ConnectionError, OSError, ValueError):
+            pass
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                self.queue.put_nowait((None, 0))
+            except queue.Full:
+                pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class FakeFinnhubServer:
+    """Replay a trade stream to every connected client.
+
+       source is an iterable of (time in ms, trades) tuples.  speed is the
+       multiple of real time to replay at, 0 for as fast as possible.  The
+       replay starts once the first client subscribes."""
+
+    def __init__(self, source, host='127.0.0.1', port=0, speed=1.0,
+                 ping_interval=DEFAULT_PING_INTERVAL,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.source = source
+        self.speed = speed
+        self.ping_interval = ping_interval
+        self.queue_size = queue_size
+        self.clients = []
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.stopped = threading.Event()
+        self.offered_trades = 0
+        self.started = None
+        self.ended = None
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen()
+        self.threads = []
+
+    @property
+    def url(self):
+        host, port = self.sock.getsockname()[:2]
+        return 'ws://{}:{}'.format(host, port)
+
+    def start(self):
+        for target in [self.accept_loop, self.replay_loop, self.ping_loop]:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        with self.lock:
+            for client in self.clients:
+                client.close()
+
+    def drop_clients(self):
+        """Cut every connection, like a network blip."""
+        with self.lock:
+            clients = [x for x in self.clients if not x.closed]
+        for client in clients:
+            client.close()
+
+        return len(clients)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handshake(self, sock):
+        """Answer the client's WebSocket upgrade request."""
+        request = b''
+        while b'\r\n\r\n' not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError('connection closed')
+            request += chunk
+
+        key = None
+        for line in request.decode('latin-1').split('\r\n'):
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'sec-websocket-key':
+                key = value.strip()
+        if key is None:
+            raise ConnectionError('not a WebSocket request')
+
+        accept = base64.b64encode(
+            hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        sock.sendall((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: {}\r\n\r\n'
+        ).format(accept).encode())
+
+    def accept_loop(self):
+        while not self.stopped.is_set():
+            try:
+                sock, _ = self.sock.accept()
+            except OSError:
+                break
+            try:
+                self.handshake(sock)
+            except (ConnectionError, OSError):
+                sock.close()
+                continue
+
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = Client(sock, queue_size=self.queue_size)
+            with self.lock:
+                self.clients.append(client)
+            for target in [client.read_loop, client.write_loop]:
+                threading.Thread(target=target, daemon=True).start()
+
+    def ping_loop(self):
+        while not self.stopped.wait(self.ping_interval):
+            with self.lock:
+                clients = list(self.clients)
+            for client in clients:
+                client.send('{"type":"ping"}')
+
+    def replay_loop(self):
+        # wait for someone to listen
+        while not self.stopped.is_set():
+            with self.lock:
+                if any(x.symbols for x in self.clients):
+                    break
+            time.sleep(0.01)
+
+        self.started = time.time()
+        first = None
+        for stamp, trades in self.source:
+            if self.stopped.is_set():
+                break
+            if first is None:
+                first = stamp
+
+            due = self.started
+            if self.speed:
+                due += (stamp - first) / 1000.0 / self.speed
+                delay = due - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                due = time.time()
+
+            due_ms = int(due * 1000)
+            self.offered_trades += len(trades)
+            with self.lock:
+                clients = list(self.clients)
+            for client in clients:
+                if client.closed:
+                    continue
+                data = [dict(x, t=due_ms, c=None) for x in trades
+                        if x['s'] in client.symbols]
+                if data:
+                    client.send(json.dumps({'type': 'trade', 'data': data},
+                                           separators=(',', ':')),
+                                trades=len(data))
+
+        self.ended = time.time()
+        self.finished.set()
+
+    def get_stats(self):
+        """Get the replay and per client send counts."""
+        with self.lock:
+            clients = list(self.clients)
+
+        return {
+            'offered_trades': self.offered_trades,
+            'queued_trades': sum(x.queued_trades for x in clients),
+            'sent_trades': sum(x.sent_trades for x in clients),
+            'dropped_messages': sum(x.dropped for x in clients),
+            'dropped_trades': sum(x.dropped_trades for x in clients),
+            'queued_messages': sum(x.queue.qsize() for x in clients),
+            'max_queued_messages': max([x.max_queued for x in clients],
+                                       default=0),
+            'pongs': sum(x.pongs for x in clients),
+        }
+
+
+def parse_args():
+    """Parse commandline options."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                        help='Port to listen on')
+    parser.add_argument('--replay',
+                        help='Recorded trade stream to replay instead of '
+                             'synthetic trades')
+    parser.add_argument('--symbols', nargs='+', default=['AAPL', 'MSFT'],
+                        help='Symbols to generate synthetic trades for')
+    parser.add_argument('--rate', type=int, default=100,
+                        help='Synthetic trades per second')
+    parser.add_argument('--batch', type=int, default=1,
+                        help='Synthetic trades per message')
+    parser.add_argument('--duration', type=float, default=60.0,
+                        help='Seconds of synthetic trades')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Multiple of real time to replay at, 0 for as '
+                             'fast as possible')
+    parser.add_argument('--ping-interval', type=float,
+                        default=DEFAULT_PING_INTERVAL,
+                        help='Seconds between pings')
+    parser.add_argument('--drop-interval', type=float, default=0.0,
+                        help='Seconds between cutting every connection, 0 '
+                             'to never')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.replay:
+        source = recorded_trades(args.replay)
+    else:
+        source = synthetic_trades(args.symbols, rate=args.rate,
+                                  duration=args.duration, batch=args.batch)
+
+    server = FakeFinnhubServer(source, args.host, args.port, speed=args.speed,
+                               ping_interval=args.ping_interval)
+    print("serving trades on {}".format(server.url))
+    server.start()
+    try:
+        while True:
+            time.sleep(args.drop_interval or 1)
+            if args.drop_interval:
+                print("dropped {} connections".format(server.drop_clients()))
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.get_stats()))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#! /usr/bin/env python3
+"""Trade stream throughput benchmark for fh-ws.py.
+
+Replays a trade stream from the fake Finnhub server (bench/fake_finnhub.py)
+into fh-ws.py's message handler at increasing multiples of real time and
+reports, for every speed, how many trades a second the handler absorbed,
+how far behind the stream it fell and how many messages were queued or
+dropped on the way.  The price table is drawn, to /dev/null, at --fps.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.fake_finnhub import (DEFAULT_PING_INTERVAL,  # noqa: E402
+                                DEFAULT_QUEUE_SIZE, FakeFinnhubServer,
+                                recorded_trades, synthetic_trades)
+from ingestion import DEFAULT_SHARD_SIZE, Ingestion  # noqa: E402
+from live_table import DEFAULT_FPS  # noqa: E402
+
+DEFAULT_SPEEDS = [1, 10, 100]
+DEFAULT_DRAIN_TIMEOUT = 30.0  # seconds
+
+TIME_RE = re.compile(r'"t":(\d+)')
+
+
+def load_fh_ws():
+    """Load a fresh copy of fh-ws.py as a module."""
+    spec = importlib.util.spec_from_file_location(
+        'fh_ws', os.path.join(ROOT, 'fh-ws.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def percentile(values, percent):
+    """Get a percentile of a sorted list."""
+    if not values:
+        return None
+
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+class Meter:
+    """Count the trades a message handler has processed and their lag."""
+
+    def __init__(self, handler, server):
+        self.handler = handler
+        self.server = server
+        self.messages = 0
+        self.trades = 0
+        self.lags = []
+        self.max_backlog = 0
+        self.first = None
+        self.last = None
+
+    def on_message(self, ws, message):
+        received = time.time()
+        if self.first is None:
+            self.first = received
+
+        self.handler(ws, message)
+
+        match = TIME_RE.search(message)
+        if match is None:
+            return
+
+        done = time.time()
+        self.last = done
+        self.messages += 1
+        self.trades += message.count('"s":')
+        self.lags.append(done * 1000 - int(match.group(1)))
+
+        backlog = self.server.offered_trades - self.trades
+        self.max_backlog = max(self.max_backlog, backlog)
+
+
+def run(source, symbols, speed, tmp_dir, ping_interval=DEFAULT_PING_INTERVAL,
+        queue_size=DEFAULT_QUEUE_SIZE, drain_timeout=DEFAULT_DRAIN_TIMEOUT,
+        fps=DEFAULT_FPS, shard_size=DEFAULT_SHARD_SIZE):
+    """Replay the source into fh-ws.py at a speed and measure it."""
+    fh_ws = load_fh_ws()
+    fh_ws.symbols = set(symbols)
+    fh_ws.price_data = {}
+    writer = fh_ws.start_writer(os.path.join(tmp_dir, 'price_data.json'))
+    board = fh_ws.open_board(os.path.join(tmp_dir, 'price_board.mmap'))
+
+    server = FakeFinnhubServer(iter(source), speed=speed,
+                               ping_interval=ping_interval,
+                               queue_size=queue_size)
+    meter = Meter(fh_ws.on_message, server)
+    ingestion = Ingestion(server.url, symbols, meter.on_message,
+                          handle_open=fh_ws.on_open,
+                          handle_error=fh_ws.on_error,
+                          shard_size=shard_size, stale_after=0,
+                          log=fh_ws.log)
+
+    with open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        table = fh_ws.start_table(fps) if fps > 0 else None
+        server.start()
+        ingestion.start()
+
+        server.finished.wait()
+        deadline = time.time() + drain_timeout
+        while time.time() < deadline:
+            if meter.trades >= server.get_stats()['queued_trades']:
+                break
+            time.sleep(0.05)
+        stats = server.get_stats()
+
+        ingestion.stop()
+        server.stop()
+        if table is not None:
+            table.close()
+        writer.close()
+        board.close()
+
+    lags = sorted(meter.lags)
+    duration = server.ended - server.started
+    processing = (meter.last or 0) - (meter.first or 0)
+
+    return {
+        'speed': speed,
+        'offered_trades': stats['offered_trades'],
+        'offered_rate': stats['offered_trades'] / duration if duration else 0,
+        'messages': meter.messages,
+        'trades': meter.trades,
+        'ingest_rate': meter.trades / processing if processing else 0,
+        'lag_p50_ms': percentile(lags, 50),
+        'lag_p95_ms': percentile(lags, 95),
+        'lag_p99_ms': percentile(lags, 99),
+        'lag_max_ms': lags[-1] if lags else None,
+        'max_backlog_trades': meter.max_backlog,
+        'max_queued_messages': stats['max_queued_messages'],
+        'dropped_messages': stats['dropped_messages'],
+        'dropped_trades': stats['dropped_trades'],
+        'unprocessed_trades': stats['queued_trades'] - meter.trades,
+        'pongs': stats['pongs'],
+        'file_writes': writer.writes,
+        'frames': table.frames if table is not None else 0,
+        'connections': len(ingestion.shards),
+    }
+
+
+def parse_args():
+    """Parse commandline options."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replay',
+                        help='Recorded trade stream to replay instead of '
+                             'synthetic trades')
+    parser.add_argument('--symbols', type=int, default=50,
+                        help='Symbols to generate synthetic trades for')
+    parser.add_argument('--rate', type=int, default=200,
+                        help='Synthetic trades per second at real time')
+    parser.add_argument('--batch', type=int, default=5,
+                        help='Synthetic trades per message')
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='Seconds of synthetic trades')
+    parser.add_argument('--speeds', type=float, nargs='+',
+                        default=DEFAULT_SPEEDS,
+                        help='Multiples of real time to replay at, 0 for as '
+                             'fast as possible')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='Messages the server queues per client before '
+                             'dropping')
+    parser.add_argument('--ping-interval', type=float,
+                        default=DEFAULT_PING_INTERVAL,
+                        help='Seconds between server pings')
+    parser.add_argument('--drain-timeout', type=float,
+                        default=DEFAULT_DRAIN_TIMEOUT,
+                        help='Seconds to wait for the handler to catch up '
+                             'after the replay')
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS,
+                        help='Most price table redraws a second, 0 for '
+                             'headless')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help='Most symbols to subscribe to per connection')
+    parser.add_argument('--json', help='Write the results to a JSON file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.replay:
+        source = list(recorded_trades(args.replay))
+        symbols = sorted({x['s'] for _, trades in source for x in trades})
+    else:
+        symbols = ['S{:05d}'.format(i) for i in range(args.symbols)]
+        source = list(synthetic_trades(symbols, rate=args.rate,
+                                       duration=args.duration,
+                                       batch=args.batch))
+
+    results = {
+        'symbols': len(symbols),
+        'messages': len(source),
+        'trades': sum(len(x) for _, x in source),
+        'runs': [],
+    }
+    print("{:>7s} {:>10s} {:>10s} {:>9s} {:>9s} {:>9s} {:>9s} {:>8s}".format(
+        'speed', 'offered/s', 'ingest/s', 'p50 ms', 'p99 ms', 'max ms',
+        'backlog', 'dropped'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for speed in args.speeds:
+            result = run(source, symbols, speed, tmp_dir,
+                         ping_interval=args.ping_interval,
+                         queue_size=args.queue_size,
+                         drain_timeout=args.drain_timeout,
+                         fps=args.fps, shard_size=args.shard_size)
+            results['runs'].append(result)
+            print("{:7g} {:10.0f} {:10.0f} {:9.1f} {:9.1f} {:9.1f} {:9d} "
+                  "{:8d}".format(
+                      speed, result['offered_rate'], result['ingest_rate'],
+                      result['lag_p50_ms'] or 0, result['lag_p99_ms'] or 0,
+                      result['lag_max_ms'] or 0,
+                      result['max_backlog_trades'],
+                      result['dropped_trades']))
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=4)
+
+
+if __name__ == '__main__':
+    main()
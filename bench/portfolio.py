@@ -0,0 +1,214 @@
+#! /usr/bin/env python3
+"""Portfolio size benchmark for the pricer.
+
+Generates synthetic shares files over a range of sizes and times each
+stage of a report and of a share change separately against a local stub
+quote server:
+
+    load     parse the shares file and build the portfolio model
+    fetch    fetch the quotes from the stub server
+    parse    value all lots at the fetched prices
+    render   build the report lines
+    mutate   apply a share change to the portfolio model
+    save     write a new snapshot of the shares file
+    journal  append the change to the journal instead
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pricer  # noqa: E402
+from bench.stub_server import StubQuoteServer  # noqa: E402
+from bench.synthetic import get_symbol, make_shares_file  # noqa: E402
+from journal import append_journal, clear_journal  # noqa: E402
+from portfolio import Portfolio  # noqa: E402
+from providers import YahooProvider  # noqa: E402
+from valuation import Valuation  # noqa: E402
+
+# symbols x positions per symbol, from a handful of lots to millions
+DEFAULT_SIZES = [
+    (10, 1),
+    (100, 10),
+    (1000, 10),
+    (1000, 50),
+    (10000, 5),
+    (100000, 1),
+]
+
+
+def parse_size(value):
+    """Parse a SYMBOLSxPOSITIONS size."""
+    try:
+        symbols, positions = value.lower().split('x')
+        return int(symbols), int(positions)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "invalid size '{}', expected SYMBOLSxPOSITIONS".format(value))
+
+
+def best_time(func, runs):
+    """Get the best wall time of runs calls of func in seconds along with
+       the result of the last call."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, result
+
+
+def load(filename):
+    with open(filename) as fp:
+        data = json.load(fp)
+
+    return data, Portfolio.from_dict(data)
+
+
+def value(share_data, data):
+    blocks = pricer.get_holding_blocks(share_data['own'])
+    valuation = Valuation(blocks)
+    valuation.set_prices(pricer.get_prices(data))
+
+    return blocks, valuation
+
+
+def render(blocks, data, valuation, verbose=False):
+    lines = []
+    for index, (symbol, items) in enumerate(blocks):
+        lines.extend(pricer.get_symbol_report(
+            symbol, items, pricer.get_market_data(data, symbol), valuation,
+            valuation.block_rows[index], verbose=verbose))
+
+    return lines
+
+
+def bench_size(symbols, positions, provider, tmp_dir, runs, verbose=False):
+    """Time every stage for one portfolio size."""
+    filename = os.path.join(tmp_dir, 'shares_{}x{}.json'.format(symbols,
+                                                                positions))
+    make_shares_file(filename, symbols, positions)
+    result = {
+        'symbols': symbols,
+        'positions': positions,
+        'lots': symbols * positions,
+        'file_size': os.path.getsize(filename),
+    }
+
+    result['load'], (share_data, portfolio) = best_time(
+        lambda: load(filename), runs)
+
+    names = [get_symbol(i) for i in range(symbols)]
+    result['fetch'], data = best_time(
+        lambda: pricer.get_quotes(names, provider), runs)
+    result['quotes'] = len(data)
+
+    result['parse'], (blocks, valuation) = best_time(
+        lambda: value(share_data, data), runs)
+
+    result['render'], lines = best_time(
+        lambda: render(blocks, data, valuation, verbose=verbose), runs)
+    result['lines'] = len(lines)
+
+    change = {'op': 'add', 'symbol': get_symbol(symbols // 2),
+              'shares': 10.0, 'cost': 123.45, 'until': None,
+              'time': time.ctime()}
+    result['mutate'], _ = best_time(
+        lambda: pricer.apply_change(portfolio, change), runs)
+
+    result['save'], _ = best_time(
+        lambda: pricer.set_share_data(filename, portfolio.to_dict()), runs)
+
+    result['journal'], _ = best_time(
+        lambda: append_journal(filename, [change], 0), runs)
+    clear_journal(filename)
+    os.remove(filename)
+
+    return result
+
+
+def bench_color_value(runs, count=100000):
+    """Get the best time of a single color_value call in seconds."""
+    def run():
+        for i in range(count):
+            pricer.color_value(i - count / 2, color='red', precision=2,
+                               percent=True)
+
+    best, _ = best_time(run, runs)
+
+    return best / count
+
+
+def parse_args():
+    """Parse commandline options."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=3,
+                        help='Number of runs per measurement')
+    parser.add_argument('--sizes', type=parse_size, nargs='+',
+                        default=DEFAULT_SIZES,
+                        help='Portfolio sizes as SYMBOLSxPOSITIONS')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Stub quote server latency in seconds')
+    parser.add_argument('--chunk-size', type=int,
+                        default=pricer.QUOTE_CHUNK_SIZE,
+                        help='Most symbols to request at once')
+    parser.add_argument('--workers', type=int,
+                        default=pricer.QUOTE_MAX_WORKERS,
+                        help='Most concurrent quote requests')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Render the verbose report')
+    parser.add_argument('--json', help='Write the results to a JSON file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'latency': args.latency,
+        'chunk_size': args.chunk_size,
+        'workers': args.workers,
+        'sizes': [],
+    }
+
+    print("{:>8s} {:>4s} {:>9s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s} "
+          "{:>10s} {:>10s}".format('symbols', 'pos', 'lots', 'load', 'fetch',
+                                   'parse', 'render', 'mutate', 'save',
+                                   'journal'))
+    with StubQuoteServer(latency=args.latency) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        provider = YahooProvider(endpoint=server.url,
+                                 chunk_size=args.chunk_size,
+                                 max_workers=args.workers)
+        for symbols, positions in args.sizes:
+            result = bench_size(symbols, positions, provider, tmp_dir,
+                                args.runs, verbose=args.verbose)
+            results['sizes'].append(result)
+            print("{:8d} {:4d} {:9d} {}".format(
+                symbols, positions, result['lots'], ' '.join(
+                    '{:8.2f}ms'.format(result[x] * 1000)
+                    for x in ['load', 'fetch', 'parse', 'render', 'mutate',
+                              'save', 'journal'])))
+        results['requests'] = server.requests
+
+    results['color_value'] = bench_color_value(args.runs)
+    print("color_value {:.3f} us per call".format(
+        results['color_value'] * 1e6))
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=4)
+
+
+if __name__ == '__main__':
+    main()
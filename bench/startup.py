@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+"""Start up time benchmark for the pricer commands.
+
+Times short lived commands as subprocesses, the way shell loops and status
+bars run them, and compares parsing a shares file with loading it from the
+binary cache.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.synthetic import make_shares_file  # noqa: E402
+from shares_cache import load_json  # noqa: E402
+
+
+def time_command(command, runs):
+    """Get the best and mean wall time of a command in seconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    return min(times), sum(times) / len(times)
+
+
+def time_load(filename, cache_dir, runs):
+    """Get the best JSON parse and cached load times in seconds."""
+    parse = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with open(filename) as fp:
+            json.load(fp)
+        parse.append(time.perf_counter() - start)
+
+    load_json(filename, cache_dir=cache_dir)  # fill the cache
+    cached = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        load_json(filename, cache_dir=cache_dir)
+        cached.append(time.perf_counter() - start)
+
+    return min(parse), min(cached)
+
+
+def parse_args():
+    """Parse commandline options."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=10,
+                        help='Number of runs per measurement')
+    parser.add_argument('--symbols', type=int, default=2000,
+                        help='Symbols in the synthetic shares file')
+    parser.add_argument('--positions', type=int, default=10,
+                        help='Positions per symbol')
+    parser.add_argument('--json', help='Write the results to a JSON file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {}
+
+    best, mean = time_command([sys.executable, '-c', 'pass'], args.runs)
+    results['interpreter'] = {'best': best, 'mean': mean}
+
+    best, mean = time_command([sys.executable, 'pricer.py', 'check',
+                               '1', '2', '3'], args.runs)
+    results['pricer_check'] = {'best': best, 'mean': mean}
+
+    best, mean = time_command([sys.executable, '-c', 'import requests'],
+                              args.runs)
+    results['import_requests'] = {'best': best, 'mean': mean}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'shares.json')
+        make_shares_file(filename, args.symbols, args.positions)
+        parse, cached = time_load(filename, os.path.join(tmp_dir, 'cache'),
+                                  args.runs)
+        results['shares_file'] = {
+            'size': os.path.getsize(filename),
+            'json_parse': parse,
+            'cached_load': cached,
+        }
+
+    for name in ['interpreter', 'pricer_check', 'import_requests']:
+        print("{:<16s} best {:8.2f} ms  mean {:8.2f} ms".format(
+            name, results[name]['best'] * 1000,
+            results[name]['mean'] * 1000))
+    shares = results['shares_file']
+    print("shares file      {} bytes: json {:.2f} ms, cached {:.2f} ms".format(
+        shares['size'], shares['json_parse'] * 1000,
+        shares['cached_load'] * 1000))
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+#! /usr/bin/env python3
+"""Local stub of the Yahoo quote endpoint.
+
+Answers every request with a Yahoo shaped quoteResponse payload holding
+made up but stable quotes for the requested symbols after a configurable
+latency, so quote fetching can be measured without the network.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def get_quote(symbol, now):
+    """Get a made up quote record for a symbol."""
+    rand = random.Random(symbol)
+    previous = round(rand.uniform(5.0, 500.0), 2)
+    price = round(previous * (1 + rand.uniform(-0.05, 0.05)), 2)
+    change = price - previous
+
+    return {
+        'symbol': symbol,
+        'marketState': 'REGULAR',
+        'regularMarketPrice': price,
+        'regularMarketChange': change,
+        'regularMarketChangePercent': change / previous * 100,
+        'regularMarketTime': now // 60 * 60,
+    }
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    """Serve quotes for the comma separated symbols parameter."""
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        query = parse_qs(urlparse(self.path).query)
+        symbols = [x for x in query.get('symbols', [''])[0].split(',') if x]
+        now = int(time.time())
+        body = json.dumps({
+            'quoteResponse': {
+                'result': [get_quote(x, now) for x in symbols],
+                'error': None,
+            },
+        }).encode()
+        self.server.requests += 1
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubQuoteServer(ThreadingHTTPServer):
+    """Stub quote server, run in a background thread with start()."""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        super().__init__((host, port), QuoteHandler)
+        self.latency = latency
+        self.requests = 0
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/v7/finance/quote'.format(host, port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_args():
+    """Parse commandline options."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=8765,
+                        help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to wait before answering a request')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = StubQuoteServer(args.host, args.port, latency=args.latency)
+    print("serving quotes on {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Synthetic shares files for the benchmarks."""
+import json
+import random
+
+
+def get_symbol(index):
+    """Get the synthetic symbol name for an index."""
+    return 'S{:05d}'.format(index)
+
+
+def make_share_data(symbols, positions, seed=0):
+    """Build share data with the given number of symbols and lots each.
+
+       The same arguments always give the same data."""
+    rand = random.Random(seed)
+    own = []
+    for i in range(symbols):
+        own.append({
+            'name': get_symbol(i),
+            'positions': [
+                {'cost': round(rand.uniform(1, 500), 2),
+                 'shares': rand.randint(1, 100)}
+                for _ in range(positions)
+            ],
+        })
+
+    return {'own': own, 'sold': {}}
+
+
+def make_shares_file(filename, symbols, positions, seed=0):
+    """Write a shares file with the given number of symbols and lots."""
+    with open(filename, 'w') as fp:
+        json.dump(make_share_data(symbols, positions, seed=seed), fp,
+                  indent=4)
@@ -0,0 +1,84 @@
+"""Coalescing background writer for JSON state files.
+
+Updates only mark keys of the data as dirty.  A writer thread saves the
+latest data at most once every interval, or sooner once enough keys are
+dirty, so a burst of updates costs one write.  The file is replaced
+atomically through a temporary file so readers never see a partial write.
+"""
+import json
+import os
+import threading
+import time
+
+DEFAULT_WRITE_INTERVAL = 0.5  # seconds
+DEFAULT_MAX_DIRTY = 50  # keys
+
+
+class CoalescingWriter:
+    """Save a dict to a JSON file from a background thread.
+
+       The dict is copied before it is serialized, which is safe while
+       another thread replaces its values or adds keys.  on_write, if
+       given, is called with the seconds each write took."""
+
+    def __init__(self, filename, data, interval=DEFAULT_WRITE_INTERVAL,
+                 max_dirty=DEFAULT_MAX_DIRTY, indent=1, on_write=None):
+        self.filename = filename
+        self.data = data
+        self.interval = interval
+        self.max_dirty = max_dirty
+        self.indent = indent
+        self.on_write = on_write
+
+        self.dirty = set()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.thread = None
+        self.writes = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def mark(self, key):
+        """Note that a key changed."""
+        dirty = self.dirty
+        dirty.add(key)
+        if len(dirty) >= self.max_dirty:
+            self.wake.set()
+
+    def run(self):
+        while not self.stopped:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write the data now if anything changed."""
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = set()
+            # a C level copy, so it does not see concurrent updates
+            data = dict(self.data)
+
+            start = time.perf_counter()
+            tmp_filename = '{}.tmp'.format(self.filename)
+            with open(tmp_filename, 'w') as fp:
+                json.dump(data, fp, indent=self.indent)
+            os.replace(tmp_filename, self.filename)
+            self.writes += 1
+
+            if self.on_write is not None:
+                self.on_write(time.perf_counter() - start)
+
+    def close(self):
+        """Stop the writer thread and write any remaining changes."""
+        self.stopped = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
@@ -1,7 +1,6 @@
 #!/usr/bin/env python3
 
 import colorama
-import finnhub
 import pprint
 import time
 
@@ -10,11 +9,14 @@ from config import API_KEY
 import os
 import json
 
-finnhub_client = finnhub.Client(api_key=API_KEY)
+from providers import FinnhubProvider
+
 symbol_file = os.path.join(os.path.expanduser('~'), 'pricer.json')
 quote_file = os.path.join(os.path.expanduser('~'), 'pricer_quotes.json')
 
 quote_data = {}
+provider = FinnhubProvider(API_KEY)
+
 
 with open(symbol_file, 'r') as fp:
     data = json.load(fp)
@@ -35,7 +37,7 @@ comp_gain = 0.0
 for symbol in sorted(symbols):
     time.sleep(0.20)
     shares = symbols[symbol]
-    data = finnhub_client.quote(symbol)
+    data = provider.get_quote(symbol)
 
     high_day = data['h']
     low_day = data['l']
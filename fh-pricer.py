@@ -1,3 +1,4 @@
+import argparse
 import datetime
 import json
 import os
@@ -7,9 +8,31 @@ import colorama
 import finnhub
 from config import API_KEY
 
+from bands import BAND_BASES, DEFAULT_DOWN, DEFAULT_UP, Bands, parse_steps
+from price_board import DEFAULT_BOARD_FILE, read_price_data
+
 
 finnhub_client = finnhub.Client(api_key=API_KEY)
 
+parser = argparse.ArgumentParser()
+parser.add_argument('--bands', action='store_true', default=False,
+                    help='Show price bands')
+parser.add_argument('--bands-from', choices=BAND_BASES, default='price',
+                    help="Base the price bands on the current price or on "
+                         "each lot's cost")
+parser.add_argument('--up', type=parse_steps, default=DEFAULT_UP,
+                    help='Comma separated percent steps up')
+parser.add_argument('--down', type=parse_steps, default=DEFAULT_DOWN,
+                    help='Comma separated percent steps down')
+parser.add_argument('--board-file', '-b', default=DEFAULT_BOARD_FILE,
+                    help="fh-ws.py's memory mapped price board, read instead "
+                         "of the price data file when it exists")
+args = parser.parse_args()
+
+bands = None
+if args.bands:
+    bands = Bands(args.up, args.down, base=args.bands_from)
+
 end = colorama.Style.RESET_ALL
 yellow = colorama.Fore.YELLOW
 
@@ -43,8 +66,11 @@ with open(os.path.join(os.path.expanduser('~'), 'pricer.json'), 'r') as fp:
     notes = data['notes']
     exclude_symbols = data['excludes']
 
-with open(price_data_file) as fp:
-    price_data = json.load(fp)
+# the board has the latest prices without parsing the price data file
+price_data = read_price_data(args.board_file)
+if not price_data:
+    with open(price_data_file) as fp:
+        price_data = json.load(fp)
 
 with open(quote_data_file) as fp:
     quotes_data = json.load(fp)
@@ -86,10 +112,9 @@ for symbol in sorted(symbols):
     if symbol in notes:
         note = notes[symbol]
 
-    up = price * 1.02
-    down = price * 0.99
-    up_down = f" - {up: .2f} {down: .2f}"
     up_down = ""
+    if bands is not None and bands.base == 'price':
+        up_down = f" - {bands.format(price)}"
     print(f"{symbol: <4} {fore}{price: >8.3f} {delta: .3f} "
           f"{delta_percent: .3f}%{end} {note} {up_down} {day_range}")
 
@@ -134,10 +159,15 @@ for symbol in sorted(symbols):
 
         tot_only = False
 
+        lot_bands = ""
+        if bands is not None and bands.base == 'cost':
+            lot_bands = f" {bands.format(cost)}"
+
         if not tot_only:
             print(f"    [{sym_count: 3d}] {count: 8.3g} {fore}{cost: 8.02f} "
                   f"{delta: >8.3f} {delta_percent: >8.3f}% {value: >8.3f}{end} "
-                  f"{yellow}{hold_str: >10}{end} {cur_value: >8.3f}")
+                  f"{yellow}{hold_str: >10}{end} {cur_value: >8.3f}"
+                  f"{lot_bands}")
         sym_count += 1
 
     # Show the total values for the symbol
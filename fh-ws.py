@@ -2,87 +2,233 @@ import argparse
 import datetime
 import json
 import os
-
-#https://pypi.org/project/websocket_client/
-import websocket
+import time
 
 import colorama
 
-from config import API_KEY
+from alerts import AlertEngine, add_holding_alerts
+from coalescing_writer import (DEFAULT_MAX_DIRTY, DEFAULT_WRITE_INTERVAL,
+                               CoalescingWriter)
+from file_watcher import DEFAULT_POLL_INTERVAL, FileWatcher
+from ingestion import (DEFAULT_BACKOFF_MAX, DEFAULT_BACKOFF_MIN,
+                       DEFAULT_SHARD_SIZE, DEFAULT_STALE_AFTER, Ingestion)
+from live_table import DEFAULT_FPS, LiveTable
+from metrics import Registry, start_metrics_server
+from price_board import DEFAULT_BOARD_FILE, PriceBoard
+from providers import PROVIDERS, get_provider
 
+FINNHUB_WS_URL = "wss://ws.finnhub.io"
 DEFAULT_SHARES_FILE=os.path.join(os.path.expanduser("~"), "pricer.json")
 DEFAULT_PRICE_DATA_FILE=os.path.join(os.path.expanduser("~"),
                                      "pricer_price_data.json")
+DEFAULT_METRICS_PORT = 9108
 
 # global data
-symbols = []
+symbols = set()
 price_data = {}
+alert_engine = AlertEngine()
+# saves price_data, set up by start_writer()
+writer = None
+# shares the last prices in place, set up by open_board()
+board = None
+# shows the last prices, set up by start_table(), None when headless
+table = None
 end = colorama.Style.RESET_ALL
 
+# metrics served by --metrics-port
+registry = Registry()
+messages_total = registry.counter(
+    'fh_ws_messages_total', 'Messages received by type', ['type'])
+trades_total = registry.counter(
+    'fh_ws_trades_total', 'Trades received by symbol', ['symbol'])
+pings_total = registry.counter(
+    'fh_ws_pings_total', 'Pings answered')
+connects_total = registry.counter(
+    'fh_ws_connects_total', 'WebSocket connections opened')
+reconnects_total = registry.counter(
+    'fh_ws_reconnects_total', 'WebSocket connections opened after the first')
+errors_total = registry.counter(
+    'fh_ws_errors_total', 'WebSocket errors')
+message_seconds = registry.histogram(
+    'fh_ws_on_message_seconds', 'Time spent handling a message')
+message_interval_seconds = registry.histogram(
+    'fh_ws_message_interval_seconds', 'Time between received messages')
+file_write_seconds = registry.histogram(
+    'fh_ws_file_write_seconds', 'Time spent writing the price data file')
+last_trade_age = registry.age(
+    'fh_ws_seconds_since_last_trade', 'Seconds since the last trade by symbol',
+    ['symbol'])
+alerts_total = registry.counter(
+    'fh_ws_alerts_total', 'Price alerts fired by symbol', ['symbol'])
+backfills_total = registry.counter(
+    'fh_ws_backfills_total', 'Prices backfilled after a reconnect by symbol',
+    ['symbol'])
+last_message_age = registry.age(
+    'fh_ws_seconds_since_last_message', 'Seconds since the last message')
+last_message = None
+
 
 def on_message(ws, message):
+    global last_message
+
+    start = time.perf_counter()
+    if last_message is not None:
+        message_interval_seconds.observe(start - last_message)
+    last_message = start
+    last_message_age.touch()
+
     # Here we would parse the data and add it to a structure or print it or
     # whatever.
     dt = datetime.datetime.today().strftime('%Y-%m-%d-%H:%M:%S')
     data = json.loads(message)
+    messages_total.inc(data['type'])
 
     if data['type'] == 'ping':
         ws.send('{"type":"pong"}')
+        pings_total.inc()
     elif data['type'] == 'trade':
-        updated = False
         for t in data['data']:
             s = t['s']
-            if s not in price_data:
-                price_data[s] = {}
-            p = t['p']
-            old_p = price_data[s]['price'] if 'price' in price_data[s] else p
-            d = p - old_p
-
-            price_data[s] = {
-                'price': p,
-                'time': t['t'],
-                'delta': d,
-            }
-            if d != 0.0:
-                updated = True
-                # print(f"{dt}: {s}: {p: .3f} {t['t']} {d: .3f}")
-        if updated:
-            show_price_data()
+            # still in flight when the symbol was unsubscribed
+            if s not in symbols:
+                continue
+            trades_total.inc(s)
+            last_trade_age.touch(s)
+            set_price(s, t['p'], t['t'], dt)
     else:
-        print(f"{dt}: {data}")
-    update_price_data_file(args.price_data_file)
+        log(f"{dt}: {data}")
+    message_seconds.observe(time.perf_counter() - start)
+
 
+def set_price(s, p, trade_time, dt):
+    """Record a symbol's latest price."""
+    for alert in alert_engine.update(s, p):
+        alerts_total.inc(s)
+        log(f"{dt}: ALERT {s} {alert.direction} {alert.price} "
+            f"at {p: .3f}")
+    old_p = price_data.get(s, {}).get('price', p)
+    d = p - old_p
 
-def show_price_data():
+    # the writer copies price_data from its own thread, so only mark the
+    # symbol once its whole record is in place
+    price_data[s] = {
+        'price': p,
+        'time': trade_time,
+        'delta': d,
+    }
+    if writer is not None:
+        writer.mark(s)
+    if board is not None:
+        board.set(s, p, trade_time, d)
+    if d != 0.0:
+        if table is not None:
+            table.mark(s)
+        # print(f"{dt}: {s}: {p: .3f} {trade_time} {d: .3f}")
 
-    print("")
-    print("")
-    for symbol, data in sorted(price_data.items()):
-        price = data['price']
-        time = data['time']
-        delta = data['delta']
 
-        if delta < 0.0:
-            fore = colorama.Fore.RED
-        elif delta > 0.0:
-            fore = colorama.Fore.GREEN
-        else:
-            fore = ""
+def on_backfill(symbol, price, trade_time):
+    """Take a REST price for a symbol unless a newer trade came in or the
+       symbol was removed while it was fetched."""
+    if symbol not in symbols:
+        return
+    if price_data.get(symbol, {}).get('time', 0) >= trade_time:
+        return
 
-        print(f"{symbol}: {fore}{price: .3f} {time} {delta: .3f}{end}")
+    backfills_total.inc(symbol)
+    dt = datetime.datetime.today().strftime('%Y-%m-%d-%H:%M:%S')
+    set_price(symbol, price, trade_time, dt)
 
 
-def on_error(ws, error):
-    print(error)
+def forget_symbol(symbol):
+    """Drop the state of a symbol that is no longer subscribed to."""
+    price_data.pop(symbol, None)
+    alert_engine.forget(symbol)
+    for metric in [trades_total, last_trade_age, alerts_total,
+                   backfills_total]:
+        metric.remove(symbol)
+    if table is not None:
+        table.remove(symbol)
+    if writer is not None:
+        writer.mark(symbol)
+    if board is not None:
+        board.remove(symbol)
+
+
+def reload_symbols(shares_filename, ingestion):
+    """Follow the open symbols of a changed shares file without
+       reconnecting, returning False if it could not be read."""
+    global symbols
+
+    try:
+        new_symbols = set(get_share_data(shares_filename)['open'])
+    except (OSError, ValueError, KeyError) as e:
+        log(f"shares file error: {e}")
+        return False
+
+    # let the trades of added symbols in right away
+    symbols = new_symbols
+    added, removed = ingestion.update_symbols(new_symbols)
+    with ingestion.lock:
+        for symbol in removed:
+            forget_symbol(symbol)
+    for symbol in added:
+        log(f'symbol: {symbol}')
+    for symbol in removed:
+        log(f'removed symbol: {symbol}')
+
+    return True
+
+
+def get_backfill(provider):
+    """Get a function that fetches symbols' last prices from a quote
+       provider."""
+    def backfill(symbols):
+        prices = {}
+        for symbol, quote in provider.get_quotes(symbols).items():
+            trade_time = (quote.get('regularMarketTime') or 0) * 1000
+            prices[symbol] = (quote['regularMarketPrice'], trade_time)
+
+        return prices
+
+    return backfill
+
+
+def get_price_row(symbol):
+    """Get the price data line for a symbol, or None once it is gone."""
+    # called from the table's thread, which may run after forget_symbol()
+    data = price_data.get(symbol)
+    if data is None:
+        return None
+    price = data['price']
+    time = data['time']
+    delta = data['delta']
+
+    if delta < 0.0:
+        fore = colorama.Fore.RED
+    elif delta > 0.0:
+        fore = colorama.Fore.GREEN
+    else:
+        fore = ""
+
+    return f"{symbol}: {fore}{price: .3f} {time} {delta: .3f}{end}"
+
+
+def log(text):
+    """Print a line, above the price table if there is one."""
+    if table is None:
+        print(text)
+    else:
+        table.log(text)
 
-def on_close(ws, *data):
-    print("### closed ###")
-    print(f"data: {data}")
 
-def on_open(ws):
-    for symbol in symbols:
-        print(f'symbol: {symbol}')
-        ws.send(f'{{"type":"subscribe","symbol":"{symbol}"}}')
+def on_error(ws, error):
+    errors_total.inc()
+    log(error)
+
+def on_open(ws, reconnect=False):
+    if reconnect:
+        reconnects_total.inc()
+    connects_total.inc()
 
 
 def parse_args():
@@ -94,6 +240,52 @@ def parse_args():
     parser.add_argument('--price-data-file', '-p',
                         default=DEFAULT_PRICE_DATA_FILE,
                         help='JSON price data file')
+    parser.add_argument('--board-file', '-b', default=DEFAULT_BOARD_FILE,
+                        help='Memory mapped price board to publish prices '
+                             'on, empty to turn it off')
+    parser.add_argument('--url', default=FINNHUB_WS_URL,
+                        help='Trade WebSocket URL')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+                        help='Most symbols to subscribe to per connection')
+    parser.add_argument('--backoff-min', type=float,
+                        default=DEFAULT_BACKOFF_MIN,
+                        help='Seconds to wait before the first reconnect')
+    parser.add_argument('--backoff-max', type=float,
+                        default=DEFAULT_BACKOFF_MAX,
+                        help='Most seconds to wait between reconnects')
+    parser.add_argument('--stale-after', type=float,
+                        default=DEFAULT_STALE_AFTER,
+                        help='Reconnect after this many seconds without '
+                             'messages, 0 to never')
+    parser.add_argument('--backfill-provider',
+                        choices=PROVIDERS + ['none'],
+                        help='Quote provider to backfill prices from after '
+                             'a reconnect (default: finnhub for the Finnhub '
+                             'URL, none for other URLs)')
+    parser.add_argument('--watch-interval', type=float,
+                        default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between checks of the shares file for '
+                             'changed symbols, 0 to never')
+    parser.add_argument('--alerts-file',
+                        help='Shares file with price_above/price_below '
+                             'alerts to watch for')
+    parser.add_argument('--alert-hysteresis', type=float, default=0.0,
+                        help='Percent the price has to move back past an '
+                             'alert price before the alert fires again')
+    parser.add_argument('--write-interval', type=float,
+                        default=DEFAULT_WRITE_INTERVAL * 1000,
+                        help='Most milliseconds between price data file '
+                             'writes')
+    parser.add_argument('--write-dirty', type=int, default=DEFAULT_MAX_DIRTY,
+                        help='Write the price data file early once this '
+                             'many symbols changed')
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS,
+                        help='Most price table redraws a second')
+    parser.add_argument('--headless', action='store_true', default=False,
+                        help='Do not show the price table')
+    parser.add_argument('--metrics-port', type=int,
+                        default=DEFAULT_METRICS_PORT,
+                        help='Port to serve metrics on, 0 to turn them off')
 
     return parser.parse_args()
 
@@ -106,23 +298,98 @@ def get_share_data(filename):
 
     return data
 
-def update_price_data_file(data_filename):
-    """Store the last price data."""
-    with open(data_filename, "w") as fp:
-         json.dump(price_data, fp, indent=1)
+def start_writer(data_filename, interval=DEFAULT_WRITE_INTERVAL,
+                 max_dirty=DEFAULT_MAX_DIRTY):
+    """Store the last price data from a background writer."""
+    global writer
+
+    writer = CoalescingWriter(data_filename, price_data, interval=interval,
+                              max_dirty=max_dirty,
+                              on_write=file_write_seconds.observe)
+    return writer.start()
+
+def start_table(fps=DEFAULT_FPS):
+    """Show the last prices, redrawn at most fps times a second."""
+    global table
+
+    table = LiveTable(get_price_row, fps=fps)
+    for symbol in price_data:
+        table.mark(symbol)
+    return table.start()
+
+def open_board(board_filename):
+    """Publish the last prices on a price board, starting from the prices
+       already on it."""
+    global board
+
+    board = PriceBoard(board_filename, writable=True)
+    price_data.update(board.to_price_data())
+    return board
 
 if __name__ == "__main__":
     args = parse_args()
 
     share_data = get_share_data(args.shares_file)
     price_data = get_share_data(args.price_data_file)
-    symbols = [x for x in share_data['open'].keys()]
+    if args.board_file:
+        # the board is newer than the last price data file write
+        open_board(args.board_file)
+    symbols = set(share_data['open'])
+    for symbol in set(price_data) - symbols:
+        forget_symbol(symbol)
+
+    alert_engine = AlertEngine(hysteresis=args.alert_hysteresis)
+    if args.alerts_file:
+        for item in get_share_data(args.alerts_file).get('own', []):
+            add_holding_alerts(alert_engine, item['name'].upper(), item)
+
+
+    start_writer(args.price_data_file, interval=args.write_interval / 1000,
+                 max_dirty=args.write_dirty)
+
+    if not args.headless and args.fps > 0:
+        start_table(args.fps)
+
+    if args.metrics_port:
+        try:
+            start_metrics_server(registry, args.metrics_port)
+        except OSError as e:
+            log(f"metrics server error: {e}")
+
+    url = args.url
+    if url == FINNHUB_WS_URL:
+        from config import API_KEY
+
+        url = f"{url}?token={API_KEY}"
 
+    backfill_provider = args.backfill_provider
+    if backfill_provider is None:
+        backfill_provider = 'finnhub' if args.url == FINNHUB_WS_URL else 'none'
+    backfill = None
+    if backfill_provider != 'none':
+        backfill = get_backfill(get_provider(backfill_provider))
 
     # websocket.enableTrace(True)
-    ws = websocket.WebSocketApp(f"wss://ws.finnhub.io?token={API_KEY}",
-                              on_message = on_message,
-                              on_error = on_error,
-                              on_close = on_close)
-    ws.on_open = on_open
-    ws.run_forever()
+    for symbol in sorted(symbols):
+        log(f'symbol: {symbol}')
+    ingestion = Ingestion(url, symbols, on_message, handle_open=on_open,
+                          handle_error=on_error, backfill=backfill,
+                          handle_backfill=on_backfill,
+                          shard_size=args.shard_size,
+                          backoff_min=args.backoff_min,
+                          backoff_max=args.backoff_max,
+                          stale_after=args.stale_after, log=log)
+    if args.watch_interval:
+        FileWatcher(args.shares_file,
+                    lambda: reload_symbols(args.shares_file, ingestion),
+                    interval=args.watch_interval).start()
+    try:
+        ingestion.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if table is not None:
+            table.close()
+        writer.close()
+        if board is not None:
+            board.close()
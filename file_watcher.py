@@ -0,0 +1,60 @@
+"""Polling file change watcher.
+
+The standard library has no inotify binding, so a thread looks at the
+file's modification time, size and inode every interval, which also
+catches a file replaced through a rename.
+"""
+import os
+import threading
+
+DEFAULT_POLL_INTERVAL = 1.0  # seconds
+
+
+class FileWatcher:
+    """Call on_change from a thread whenever a file changes.
+
+       on_change returns False when it could not use the file, for example
+       because it was read half written, and is then called again on the
+       next poll."""
+
+    def __init__(self, filename, on_change, interval=DEFAULT_POLL_INTERVAL):
+        self.filename = filename
+        self.on_change = on_change
+        self.interval = interval
+        self.last = self.get_stat()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def get_stat(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """Call on_change if the file changed, returning whether it did."""
+        stat = self.get_stat()
+        if stat is None or stat == self.last:
+            return False
+        if self.on_change() is False:
+            return False
+        self.last = stat
+
+        return True
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,73 @@
+"""Shared HTTP session for the quote providers.
+
+requests is only imported once a session is created so that commands which
+never go to the network do not pay for the import.
+"""
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.3
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_timeout = DEFAULT_TIMEOUT
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                   backoff=DEFAULT_BACKOFF):
+    """Create a session with a keep-alive connection pool and retries."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+
+    return session
+
+
+def configure_session(pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES,
+                      backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT):
+    """Replace the shared session with one using the given settings."""
+    global _session, _timeout
+
+    if _session is not None:
+        _session.close()
+    _session = create_session(pool_size=pool_size, retries=retries,
+                              backoff=backoff)
+    _timeout = timeout
+
+    return _session
+
+
+def get_session():
+    """Get the shared session, creating it with the defaults if needed."""
+    global _session
+
+    if _session is None:
+        _session = create_session()
+
+    return _session
+
+
+def get(url, timeout=None, **kwargs):
+    """Issue a GET request on the shared session."""
+    if timeout is None:
+        timeout = _timeout
+
+    return get_session().get(url, timeout=timeout, **kwargs)
@@ -0,0 +1,299 @@
+"""Sharded, reconnecting trade stream ingestion.
+
+Symbols are split across WebSocket connections of at most shard_size
+subscriptions each.  Every connection runs on its own thread, subscribes
+its symbols whenever it opens and reconnects after a close with jittered
+exponential backoff.  A connection that has been silent for stale_after
+seconds is closed and reconnected, and after every reconnect the
+connection's symbols are backfilled from a REST quote so a gap does not
+leave stale prices until the next trade.  The symbol set can be changed
+on the fly: only the needed subscribe and unsubscribe messages are sent on
+the live connections.
+
+Messages of all connections are handled one at a time, so the handler
+does not need to be thread safe.
+"""
+import random
+import threading
+import time
+
+import websocket
+
+DEFAULT_SHARD_SIZE = 50  # symbols per connection
+DEFAULT_BACKOFF_MIN = 1.0  # seconds
+DEFAULT_BACKOFF_MAX = 60.0  # seconds
+DEFAULT_STALE_AFTER = 60.0  # seconds
+
+
+def get_request(request, symbol):
+    """Get a subscribe or unsubscribe message for a symbol."""
+    return '{{"type":"{}","symbol":"{}"}}'.format(request, symbol)
+
+
+def get_shards(symbols, size=DEFAULT_SHARD_SIZE):
+    """Split symbols into sorted lists of at most size symbols."""
+    symbols = sorted(symbols)
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
+
+
+def get_backoff(attempt, low=DEFAULT_BACKOFF_MIN, high=DEFAULT_BACKOFF_MAX):
+    """Get the seconds to wait before a reconnect attempt, between half and
+       all of low doubled for every earlier attempt, up to high."""
+    delay = min(high, low * 2 ** attempt)
+    return random.uniform(delay / 2, delay)
+
+
+class Shard:
+    """One connection and the symbols it subscribes to."""
+
+    def __init__(self, ingestion, index, symbols):
+        self.ingestion = ingestion
+        self.index = index
+        self.symbols = list(symbols)
+        self.ws = None
+        self.thread = None
+        self.connects = 0
+        self.connected = False
+        self.stopped = False
+        self.messages = 0
+        self.last_message = None
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        ingestion = self.ingestion
+        attempt = 0
+        while not ingestion.stopped.is_set() and not self.stopped:
+            self.ws = websocket.WebSocketApp(ingestion.url,
+                                             on_open=self.on_open,
+                                             on_message=self.on_message,
+                                             on_error=self.on_error,
+                                             on_close=self.on_close)
+            messages = self.messages
+            self.ws.run_forever()
+            self.connected = False
+            if ingestion.stopped.is_set() or self.stopped:
+                break
+
+            # start over after a connection that worked, but keep backing
+            # off from one that opened and then stayed silent
+            if self.messages > messages:
+                attempt = 0
+            delay = get_backoff(attempt, ingestion.backoff_min,
+                                ingestion.backoff_max)
+            attempt += 1
+            ingestion.log("shard {}: reconnecting in {:.1f}s".format(
+                self.index, delay))
+            ingestion.stopped.wait(delay)
+
+    def on_open(self, ws):
+        ingestion = self.ingestion
+        reconnect = self.connects > 0
+        self.connects += 1
+        self.connected = True
+        self.last_message = time.monotonic()
+
+        with ingestion.lock:
+            symbols = list(self.symbols)
+            for symbol in symbols:
+                ws.send(get_request('subscribe', symbol))
+            if ingestion.handle_open is not None:
+                ingestion.handle_open(ws, reconnect)
+        if reconnect:
+            ingestion.start_backfill(symbols)
+
+    def on_message(self, ws, message):
+        self.messages += 1
+        self.last_message = time.monotonic()
+        ingestion = self.ingestion
+        with ingestion.lock:
+            ingestion.handle_message(ws, message)
+
+    def on_error(self, ws, error):
+        ingestion = self.ingestion
+        if ingestion.handle_error is not None:
+            with ingestion.lock:
+                ingestion.handle_error(ws, error)
+
+    def on_close(self, ws, *data):
+        self.ingestion.log("shard {}: closed {}".format(self.index, data))
+
+    def subscribe(self, symbols):
+        self.symbols.extend(symbols)
+        self.send('subscribe', symbols)
+
+    def unsubscribe(self, symbols):
+        self.symbols = [x for x in self.symbols if x not in symbols]
+        self.send('unsubscribe', symbols)
+
+    def send(self, request, symbols):
+        """Send requests for symbols on the live connection, if there is
+           one.  A connection that opens later subscribes to its symbols
+           anyway."""
+        if not self.connected:
+            return
+        try:
+            for symbol in symbols:
+                self.ws.send(get_request(request, symbol))
+        except websocket.WebSocketException:
+            pass
+
+    def stop(self):
+        self.stopped = True
+        self.close()
+
+    def close(self):
+        """Drop the connection without waiting for the server, which also
+           wakes the thread reading from it."""
+        ws = self.ws
+        if ws is None:
+            return
+        ws.keep_running = False
+        sock = ws.sock
+        if sock is not None:
+            sock.abort()
+
+
+class Ingestion:
+    """Stream trades for symbols from a WebSocket URL over shards of
+       connections.
+
+       handle_message(ws, message), handle_open(ws, reconnect) and
+       handle_error(ws, error) get the connections' events.  backfill, if
+       given, is called with symbols after a reconnect and returns
+       {symbol: (price, trade time in ms)}, which is passed on to
+       handle_backfill(symbol, price, trade time)."""
+
+    def __init__(self, url, symbols, handle_message, handle_open=None,
+                 handle_error=None, backfill=None, handle_backfill=None,
+                 shard_size=DEFAULT_SHARD_SIZE,
+                 backoff_min=DEFAULT_BACKOFF_MIN,
+                 backoff_max=DEFAULT_BACKOFF_MAX,
+                 stale_after=DEFAULT_STALE_AFTER, log=print):
+        self.url = url
+        self.handle_message = handle_message
+        self.handle_open = handle_open
+        self.handle_error = handle_error
+        self.backfill = backfill
+        self.handle_backfill = handle_backfill
+        self.shard_size = shard_size
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.stale_after = stale_after
+        self.log = log
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.shards = [Shard(self, i, x)
+                       for i, x in enumerate(get_shards(symbols, shard_size))]
+        self.next_index = len(self.shards)
+        self.watchdog = None
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+        if self.stale_after:
+            self.watchdog = threading.Thread(target=self.watch, daemon=True)
+            self.watchdog.start()
+
+        return self
+
+    def watch(self):
+        """Close connections that stopped sending anything."""
+        interval = min(1.0, self.stale_after / 4)
+        while not self.stopped.wait(interval):
+            now = time.monotonic()
+            for shard in list(self.shards):
+                if (
+                    shard.connected and
+                    now - shard.last_message > self.stale_after
+                ):
+                    self.log("shard {}: no messages for {:.0f}s".format(
+                        shard.index, now - shard.last_message))
+                    shard.connected = False
+                    shard.close()
+
+    def get_symbols(self):
+        return sorted(x for shard in self.shards for x in shard.symbols)
+
+    def update_symbols(self, symbols):
+        """Follow a new set of symbols, returning the lists of added and
+           removed symbols.
+
+           Removed symbols are unsubscribed from their connections and added
+           ones subscribed on connections with room, or on new connections,
+           and backfilled.  Connections left without symbols are closed."""
+        symbols = set(symbols)
+        with self.lock:
+            current = set(self.get_symbols())
+            added = sorted(symbols - current)
+            removed = sorted(current - symbols)
+
+            gone = set(removed)
+            for shard in self.shards:
+                unsubscribe = [x for x in shard.symbols if x in gone]
+                if unsubscribe:
+                    shard.unsubscribe(unsubscribe)
+
+            pending = added
+            for shard in self.shards:
+                room = self.shard_size - len(shard.symbols)
+                if pending and room > 0:
+                    shard.subscribe(pending[:room])
+                    pending = pending[room:]
+
+            new_shards = []
+            for chunk in get_shards(pending, self.shard_size):
+                new_shards.append(Shard(self, self.next_index, chunk))
+                self.next_index += 1
+
+            for shard in self.shards:
+                if not shard.symbols:
+                    shard.stop()
+            self.shards = [x for x in self.shards if x.symbols] + new_shards
+
+        if not self.stopped.is_set():
+            for shard in new_shards:
+                shard.start()
+        self.start_backfill(added)
+
+        return added, removed
+
+    def start_backfill(self, symbols):
+        if symbols and self.backfill is not None:
+            threading.Thread(target=self.run_backfill, args=(symbols,),
+                             daemon=True).start()
+
+    def run_backfill(self, symbols):
+        try:
+            prices = self.backfill(symbols)
+        except Exception as e:
+            self.log("backfill error: {}".format(e))
+            return
+
+        with self.lock:
+            for symbol, (price, trade_time) in sorted(prices.items()):
+                self.handle_backfill(symbol, price, trade_time)
+
+    def run_forever(self):
+        """Stream until stop() is called or the main thread is
+           interrupted."""
+        self.start()
+        try:
+            while not self.stopped.wait(1.0):
+                pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.stopped.set()
+        shards = list(self.shards)
+        for shard in shards:
+            shard.close()
+        for shard in shards:
+            if shard.thread is not None:
+                shard.thread.join(5)
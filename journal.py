@@ -0,0 +1,74 @@
+"""Append-only journal of share data mutations.
+
+Every mutation is one JSON document per line in a journal file next to the
+shares file.  Each record has an increasing "seq" number and the shares
+file snapshot stores the last sequence number folded into it, so records
+already in the snapshot are never applied twice.
+"""
+import json
+import os
+
+SNAPSHOT_SEQ_KEY = 'journal_seq'
+
+
+def get_journal_filename(filename):
+    """Get the journal file name for a shares file."""
+    return '{}.journal'.format(filename)
+
+
+def read_journal(filename, after=0):
+    """Read the journal records with a sequence number after the given one.
+
+       Truncated records, e.g. from a crash mid-write, and records without
+       a sequence number are ignored."""
+    records = []
+    try:
+        with open(get_journal_filename(filename)) as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if (
+                    not isinstance(record, dict) or
+                    not isinstance(record.get('seq'), int)
+                ):
+                    continue
+                if record['seq'] > after:
+                    records.append(record)
+    except IOError:
+        pass
+
+    return records
+
+
+def append_journal(filename, records, last_seq):
+    """Append records to the journal, numbering them after last_seq.
+
+       Returns the sequence number of the last record written."""
+    lines = []
+    for record in records:
+        last_seq += 1
+        record = dict(record, seq=last_seq)
+        lines.append(json.dumps(record, separators=(',', ':')))
+
+    with open(get_journal_filename(filename), 'a+') as fp:
+        # start on a new line if the last write was cut short
+        if fp.tell() > 0:
+            fp.seek(fp.tell() - 1)
+            if fp.read(1) != '\n':
+                fp.write('\n')
+        fp.write('\n'.join(lines))
+        fp.write('\n')
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    return last_seq
+
+
+def clear_journal(filename):
+    """Remove the journal once it has been folded into the snapshot."""
+    try:
+        os.remove(get_journal_filename(filename))
+    except FileNotFoundError:
+        pass
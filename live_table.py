@@ -0,0 +1,149 @@
+"""Frame rate limited terminal table.
+
+Updates only mark rows as dirty.  A render thread redraws at most fps
+times a second and, on a terminal, rewrites just the rows whose text
+changed in place with cursor movement.  The whole table is drawn again
+when rows are added or other output was logged above it.  Output that is
+not a terminal gets the whole table every frame that has changes.
+"""
+import sys
+import threading
+
+DEFAULT_FPS = 10
+
+CURSOR_UP = '\x1b[{}A'
+CURSOR_DOWN = '\x1b[{}B'
+CLEAR_LINE = '\x1b[K'
+CLEAR_DOWN = '\x1b[J'
+
+
+class LiveTable:
+    """Redraw the rows of a table of keys, sorted by key, from a thread.
+
+       get_row is called with a key to get the text of its row, or None
+       once the key is gone."""
+
+    def __init__(self, get_row, fps=DEFAULT_FPS, fp=None):
+        self.get_row = get_row
+        self.interval = 1 / fps
+        self.fp = fp or sys.stdout
+        self.in_place = self.fp.isatty()
+
+        self.dirty = set()
+        self.removed = set()
+        # key -> row text as drawn
+        self.lines = {}
+        # keys in row order
+        self.keys = []
+        self.positions = {}
+        self.full = True
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.frames = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def mark(self, key):
+        """Note that a key's row changed."""
+        self.dirty.add(key)
+
+    def remove(self, key):
+        """Drop a key's row."""
+        self.removed.add(key)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.draw()
+
+    def draw(self):
+        """Draw the changed rows now."""
+        # C level calls, so keys marked while drawing stay dirty
+        keys = list(self.dirty)
+        self.dirty.difference_update(keys)
+        removed = list(self.removed)
+        self.removed.difference_update(removed)
+        if not keys and not removed and not self.full:
+            return
+
+        with self.lock:
+            positions = self.positions
+            if (
+                self.full or removed or
+                any(x not in positions for x in keys)
+            ):
+                self.draw_all(set(self.keys).union(keys).difference(removed))
+            elif self.in_place:
+                self.draw_rows(keys)
+            else:
+                self.draw_all(self.keys)
+            self.fp.flush()
+            self.frames += 1
+
+    def draw_all(self, keys):
+        out = []
+        if self.in_place:
+            if not self.full and self.keys:
+                # back to the top of the table as drawn
+                out.append('\r')
+                out.append(CURSOR_UP.format(len(self.keys)))
+            out.append(CLEAR_DOWN)
+        else:
+            out.append('\n')
+
+        lines = {}
+        for key in keys:
+            line = self.get_row(key)
+            if line is not None:
+                lines[key] = line
+        self.keys = sorted(lines)
+        self.positions = {x: i for i, x in enumerate(self.keys)}
+        self.lines = lines
+        for key in self.keys:
+            out.append(self.lines[key])
+            out.append('\n')
+        self.fp.write(''.join(out))
+        self.full = False
+
+    def draw_rows(self, keys):
+        lines = self.lines
+        count = len(self.keys)
+        out = []
+        for key in keys:
+            line = self.get_row(key)
+            if line is None:
+                self.removed.add(key)
+                continue
+            if line == lines[key]:
+                continue
+            lines[key] = line
+            up = count - self.positions[key]
+            out.append('\r')
+            out.append(CURSOR_UP.format(up))
+            out.append(line)
+            out.append(CLEAR_LINE)
+            out.append('\r')
+            out.append(CURSOR_DOWN.format(up))
+        if out:
+            self.fp.write(''.join(out))
+
+    def log(self, text):
+        """Print text above the table, which is drawn again below it."""
+        with self.lock:
+            if self.in_place and self.keys and not self.full:
+                self.fp.write('\r{}{}'.format(
+                    CURSOR_UP.format(len(self.keys)), CLEAR_DOWN))
+            self.fp.write('{}\n'.format(text))
+            self.fp.flush()
+            self.full = True
+
+    def close(self):
+        """Stop the render thread after drawing any remaining changes."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.draw()
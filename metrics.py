@@ -0,0 +1,224 @@
+"""Prometheus style metrics for long running processes.
+
+Metrics are plain counters, gauges and histograms kept in dicts and lists.
+Updates take no locks: each metric is meant to be updated from a single
+thread, such as a WebSocket callback thread, and a scrape reads a copy of
+the values on the metrics server's thread.
+"""
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_METRICS_HOST = '127.0.0.1'
+
+# seconds, from sub-millisecond handlers to slow disks
+DEFAULT_BUCKETS = [
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0,
+]
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs))
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class for metrics with optional labels."""
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def samples(self):
+        """Get the (name suffix, label values, extra label, value) samples
+           for a scrape."""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.help),
+            '# TYPE {} {}'.format(self.name, self.type),
+        ]
+        for suffix, values, extra, value in self.samples():
+            lines.append('{}{}{} {}'.format(
+                self.name, suffix, format_labels(self.labels, values, extra),
+                format_value(value)))
+
+        return lines
+
+
+class Counter(Metric):
+    """A count that only goes up."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def remove(self, *labels):
+        """Stop reporting a label set."""
+        self.values.pop(labels, None)
+
+    def samples(self):
+        values = self.values.copy()
+        if not self.labels and not values:
+            values[()] = 0
+
+        return [('', k, None, v) for k, v in sorted(values.items())]
+
+
+class Gauge(Metric):
+    """A value that can go up and down."""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def get(self, *labels):
+        return self.values.get(labels)
+
+    def remove(self, *labels):
+        """Stop reporting a label set."""
+        self.values.pop(labels, None)
+
+    def samples(self):
+        values = self.values.copy()
+        return [('', k, None, v) for k, v in sorted(values.items())]
+
+
+class Age(Gauge):
+    """Seconds since each label set was last touched, worked out at scrape
+       time."""
+
+    def touch(self, *labels, when=None):
+        self.values[labels] = time.time() if when is None else when
+
+    def samples(self):
+        now = time.time()
+        return [('', k, None, now - v)
+                for k, v in sorted(self.values.copy().items())]
+
+
+class Histogram(Metric):
+    """Counts of observations in cumulative buckets along with their sum.
+
+       Observations are counted in their own bucket and the buckets are
+       only accumulated at scrape time."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        counts = list(self.counts)
+        total = self.sum
+        samples = []
+        running = 0
+        for bound, count in zip(self.buckets + [float('inf')], counts):
+            running += count
+            samples.append(('_bucket', (), ('le', format_value(bound)),
+                            running))
+        samples.append(('_sum', (), None, total))
+        samples.append(('_count', (), None, running))
+
+        return samples
+
+
+class Registry:
+    """A set of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.add(Gauge(name, help, labels))
+
+    def age(self, name, help, labels=()):
+        return self.add(Age(name, help, labels))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(name, help, buckets))
+
+    def render(self):
+        """Get the metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(registry, port, host=DEFAULT_METRICS_HOST):
+    """Serve the registry's metrics from a background thread."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
@@ -0,0 +1,199 @@
+"""Indexed in-memory model of the shares file.
+
+The model loads from and saves to the shares file JSON schema:
+
+    {
+        "own": [
+            {"name": ..., "positions": [{"cost": ..., "shares": ...}, ...],
+             ...},
+            ...
+        ],
+        "sold": {name: [position, ...], ...},
+        ...
+    }
+
+Holdings are indexed by lower case symbol and each holding keeps its
+positions ordered by cost along with a separate index of the visible
+(non-hidden) positions.
+"""
+import bisect
+
+
+class Position:
+    """A single lot of shares."""
+
+    __slots__ = ('cost', 'shares', 'until', 'hide', 'extra')
+
+    def __init__(self, cost, shares, until=None, hide=False, extra=None):
+        self.cost = cost
+        self.shares = shares
+        self.until = until
+        self.hide = hide
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {k: v for k, v in data.items()
+                 if k not in ('cost', 'shares', 'until', 'hide')}
+        return cls(data.get('cost'), data.get('shares'),
+                   until=data.get('until'), hide=data.get('hide', False),
+                   extra=extra or None)
+
+    def to_dict(self):
+        data = {
+            'cost': self.cost,
+            'shares': self.shares,
+        }
+        if self.until is not None:
+            data['until'] = self.until
+        if self.hide:
+            data['hide'] = True
+        if self.extra:
+            data.update(self.extra)
+
+        return data
+
+
+class Holding:
+    """A symbol's positions along with its other settings."""
+
+    __slots__ = ('name', 'data', 'positions', 'costs', 'visible',
+                 'visible_costs')
+
+    def __init__(self, name, data=None, positions=None):
+        self.name = name
+        # holding settings other than the name and positions
+        self.data = data or {}
+        # None if the holding has no positions list
+        self.positions = None
+        self.costs = []
+        self.visible = []
+        self.visible_costs = []
+        if positions is not None:
+            self.positions = []
+            for position in sorted(positions, key=lambda r: r.cost):
+                self.add_position(position)
+
+    @classmethod
+    def from_dict(cls, data):
+        positions = data.get('positions')
+        if positions is not None:
+            positions = [Position.from_dict(x) for x in positions]
+        other = {k: v for k, v in data.items()
+                 if k not in ('name', 'positions')}
+
+        return cls(data['name'], data=other, positions=positions)
+
+    def to_dict(self):
+        data = {'name': self.name}
+        data.update(self.data)
+        if self.positions is not None:
+            data['positions'] = [x.to_dict() for x in self.positions]
+
+        return data
+
+    def add_position(self, position):
+        """Insert a position keeping the positions ordered by cost."""
+        if self.positions is None:
+            self.positions = []
+
+        index = bisect.bisect_right(self.costs, position.cost)
+        self.costs.insert(index, position.cost)
+        self.positions.insert(index, position)
+
+        if not position.hide:
+            index = bisect.bisect_right(self.visible_costs, position.cost)
+            self.visible_costs.insert(index, position.cost)
+            self.visible.insert(index, position)
+
+    def remove_position(self, position):
+        """Remove a position from the holding."""
+        index = self.find(self.positions, self.costs, position)
+        del self.costs[index]
+        del self.positions[index]
+
+        index = self.find(self.visible, self.visible_costs, position)
+        if index is not None:
+            del self.visible_costs[index]
+            del self.visible[index]
+
+    def hide_position(self, position):
+        """Hide a position, dropping it from the visible positions."""
+        index = self.find(self.visible, self.visible_costs, position)
+        if index is not None:
+            del self.visible_costs[index]
+            del self.visible[index]
+        position.hide = True
+
+    def get_position(self, index):
+        """Get a visible position by its index.
+
+           Raises ValueError for an invalid index."""
+        if index < 0 or index >= len(self.visible):
+            raise ValueError("Invalid position")
+
+        return self.visible[index]
+
+    @staticmethod
+    def find(positions, costs, position):
+        """Get the index of a position in a cost ordered list."""
+        index = bisect.bisect_left(costs, position.cost)
+        while index < len(positions) and costs[index] == position.cost:
+            if positions[index] is position:
+                return index
+            index += 1
+
+        return None
+
+
+class Portfolio:
+    """The user's holdings indexed by symbol plus the sold positions."""
+
+    __slots__ = ('holdings', 'index', 'sold', 'data')
+
+    def __init__(self, holdings=None, sold=None, data=None):
+        self.holdings = []
+        # lower case symbol -> holdings
+        self.index = {}
+        self.sold = sold if sold is not None else {}
+        # other top level settings
+        self.data = data or {}
+        for holding in holdings or []:
+            self.add_holding(holding)
+
+    @classmethod
+    def from_dict(cls, data):
+        other = {k: v for k, v in data.items() if k not in ('own', 'sold')}
+        holdings = [Holding.from_dict(x) for x in data.get('own', [])]
+
+        return cls(holdings, sold=data.get('sold'), data=other)
+
+    def to_dict(self):
+        data = {
+            'own': [x.to_dict() for x in self.holdings],
+            'sold': self.sold,
+        }
+        data.update(self.data)
+
+        return data
+
+    def add_holding(self, holding):
+        """Add a holding to the end of the portfolio."""
+        self.holdings.append(holding)
+        self.index.setdefault(holding.name.lower(), []).append(holding)
+
+        return holding
+
+    def find(self, symbol):
+        """Get the holdings for a symbol, if any."""
+        return self.index.get(symbol.lower(), [])
+
+    def get(self, symbol):
+        """Get the holdings for a symbol.
+
+           Raises ValueError if the symbol is not held."""
+        holdings = self.find(symbol)
+        if not holdings:
+            raise ValueError("ERROR: {} not found".format(symbol.lower()))
+
+        return holdings
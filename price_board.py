@@ -0,0 +1,328 @@
+#! /usr/bin/env python3
+"""Memory mapped board of the latest trade prices.
+
+fh-ws.py writes each symbol's last price in place and any number of
+readers get the latest prices without parsing or locking.  The file holds
+a header, a directory of symbol names and a fixed size slot per symbol:
+
+    header     magic, version, capacity, slots used, generation
+    directory  capacity x 32 byte NUL padded symbol names
+    slots      capacity x (sequence, price, trade time in ms, delta)
+
+Slots are kept consistent seqlock style: the single writer makes the
+sequence number odd, writes the values and makes it even again, and a
+reader retries until it sees the same even sequence number before and
+after reading the values.  A sequence number of 0 means no trade.
+
+New symbols are appended to the directory.  A removed symbol's slot is
+cleared and its name blanked, and the slot is given to the next new
+symbol.  The generation goes up whenever a name is blanked or replaced,
+and a reader that sees it change reads the whole directory again before
+trusting a slot.  Counts and sequence numbers are in native byte order;
+the board is for readers on the same host.
+"""
+import argparse
+import mmap
+import os
+import struct
+import time
+
+DEFAULT_BOARD_FILE = os.path.join(os.path.expanduser('~'),
+                                  'pricer_price_board.mmap')
+DEFAULT_CAPACITY = 4096  # symbols
+
+MAGIC = b'PRCBOARD'
+VERSION = 2
+HEADER = struct.Struct('8sIIII')
+HEADER_SIZE = 64
+NAME_SIZE = 32
+# The symbol count, generation and sequence numbers have to change in one
+# store.
+# struct.pack_into() clears a field before packing into it, so they are
+# packed first and copied in, and they are native order because CPython
+# reads little endian integers a byte at a time but native ones in one go.
+COUNT_OFFSET = 16
+COUNT = struct.Struct('I')
+GENERATION_OFFSET = 20
+GENERATION = struct.Struct('I')
+SEQ = struct.Struct('Q')
+VALUES = struct.Struct('<dqd')
+SLOT_SIZE = SEQ.size + VALUES.size
+
+# seconds a slot can stay mid write before a reader gives up on its writer
+STUCK_TIMEOUT = 0.1
+
+
+def get_file_size(capacity):
+    return HEADER_SIZE + capacity * (NAME_SIZE + SLOT_SIZE)
+
+
+class PriceBoard:
+    """A price board file opened for reading or, by the one writer, for
+       writing.
+
+       A writer creates the file if it does not exist or is not a board
+       and otherwise keeps the prices already on it."""
+
+    def __init__(self, filename=DEFAULT_BOARD_FILE, writable=False,
+                 capacity=DEFAULT_CAPACITY):
+        self.filename = filename
+        self.writable = writable
+        # symbol -> slot
+        self.index = {}
+        self.count = 0
+        self.generation = None
+        # slots of removed symbols, for the writer
+        self.free = []
+        # slot -> sequence number, for the writer
+        self.seqs = {}
+
+        if writable:
+            self.fp = self.open_writable(filename, capacity)
+            access = mmap.ACCESS_WRITE
+        else:
+            self.fp = open(filename, 'rb')
+            access = mmap.ACCESS_READ
+        self.map = mmap.mmap(self.fp.fileno(), 0, access=access)
+
+        magic, version, self.capacity, _, _ = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("{} is not a price board".format(filename))
+        self.slots_offset = HEADER_SIZE + self.capacity * NAME_SIZE
+        self.refresh()
+
+    @staticmethod
+    def open_writable(filename, capacity):
+        try:
+            fp = open(filename, 'r+b')
+            header = fp.read(HEADER.size)
+            if len(header) == HEADER.size:
+                magic, version, file_capacity, _, _ = HEADER.unpack(header)
+                if (
+                    magic == MAGIC and version == VERSION and
+                    os.fstat(fp.fileno()).st_size ==
+                    get_file_size(file_capacity)
+                ):
+                    return fp
+            fp.close()
+        except FileNotFoundError:
+            pass
+
+        # build the new board next to the old one and swap it in
+        tmp_filename = '{}.tmp'.format(filename)
+        with open(tmp_filename, 'wb') as fp:
+            fp.truncate(get_file_size(capacity))
+            fp.write(HEADER.pack(MAGIC, VERSION, capacity, 0, 0))
+        os.replace(tmp_filename, filename)
+
+        return open(filename, 'r+b')
+
+    def close(self):
+        if getattr(self, 'map', None) is not None:
+            self.map.close()
+            self.map = None
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_generation(self):
+        return GENERATION.unpack_from(self.map, GENERATION_OFFSET)[0]
+
+    def refresh(self):
+        """Pick up symbols added to the directory since the last look, or
+           read it all again if names were blanked or replaced."""
+        generation = self.get_generation()
+        if generation != self.generation:
+            self.index = {}
+            self.count = 0
+            self.free = []
+            self.generation = generation
+
+        count = COUNT.unpack_from(self.map, COUNT_OFFSET)[0]
+        for slot in range(self.count, min(count, self.capacity)):
+            offset = HEADER_SIZE + slot * NAME_SIZE
+            name = self.map[offset:offset + NAME_SIZE].rstrip(b'\0')
+            if name:
+                self.index[name.decode()] = slot
+            else:
+                self.free.append(slot)
+        self.count = count
+
+    def bump_generation(self):
+        self.generation = (self.generation + 1) & 0xffffffff
+        self.map[GENERATION_OFFSET:GENERATION_OFFSET + GENERATION.size] = \
+            GENERATION.pack(self.generation)
+
+    def add_symbol(self, symbol):
+        """Give a symbol a slot, returning the slot."""
+        name = symbol.encode()
+        if len(name) > NAME_SIZE:
+            raise ValueError("symbol too long: {}".format(symbol))
+
+        if self.free:
+            slot = self.free.pop()
+            offset = HEADER_SIZE + slot * NAME_SIZE
+            self.map[offset:offset + NAME_SIZE] = \
+                name.ljust(NAME_SIZE, b'\0')
+            # readers may still map the slot to the symbol it had
+            self.bump_generation()
+        else:
+            if self.count >= self.capacity:
+                raise ValueError("price board is full")
+            slot = self.count
+            offset = HEADER_SIZE + slot * NAME_SIZE
+            self.map[offset:offset + NAME_SIZE] = \
+                name.ljust(NAME_SIZE, b'\0')
+            # publish the name only once it is in place
+            self.count += 1
+            self.map[COUNT_OFFSET:COUNT_OFFSET + COUNT.size] = \
+                COUNT.pack(self.count)
+        self.index[symbol] = slot
+
+        return slot
+
+    def remove(self, symbol):
+        """Drop a symbol, freeing its slot for the next new symbol."""
+        slot = self.index.pop(symbol, None)
+        if slot is None:
+            return
+
+        # clear the prices first, so a reader that still has the slot sees
+        # no trade rather than one of the next symbol's
+        offset = self.slots_offset + slot * SLOT_SIZE
+        end = offset + SEQ.size
+        self.map[offset:end] = SEQ.pack(self.get_seq(slot) + 1)
+        VALUES.pack_into(self.map, end, 0.0, 0, 0.0)
+        self.map[offset:end] = SEQ.pack(0)
+        self.seqs[slot] = 0
+
+        offset = HEADER_SIZE + slot * NAME_SIZE
+        self.map[offset:offset + NAME_SIZE] = bytes(NAME_SIZE)
+        self.bump_generation()
+        self.free.append(slot)
+
+    def get_seq(self, slot):
+        """Get the even sequence number a slot's next write starts from."""
+        seq = self.seqs.get(slot)
+        if seq is None:
+            offset = self.slots_offset + slot * SLOT_SIZE
+            seq = SEQ.unpack_from(self.map, offset)[0]
+            # a writer stopped half way through an update
+            seq += seq & 1
+
+        return seq
+
+    def set(self, symbol, price, trade_time, delta):
+        """Write a symbol's latest trade."""
+        slot = self.index.get(symbol)
+        if slot is None:
+            slot = self.add_symbol(symbol)
+
+        offset = self.slots_offset + slot * SLOT_SIZE
+        seq = self.get_seq(slot)
+        end = offset + SEQ.size
+        self.map[offset:end] = SEQ.pack(seq + 1)
+        VALUES.pack_into(self.map, end, price, trade_time, delta)
+        self.map[offset:end] = SEQ.pack(seq + 2)
+        self.seqs[slot] = seq + 2
+
+    def get(self, symbol):
+        """Get a symbol's latest (price, time, delta, sequence number), or
+           None if it has no trade yet."""
+        while True:
+            slot = self.index.get(symbol)
+            if slot is None:
+                self.refresh()
+                slot = self.index.get(symbol)
+                if slot is None:
+                    return None
+
+            value = self.read_slot(slot)
+            # the slot is only the symbol's if no name changed meanwhile
+            if self.get_generation() == self.generation:
+                return value
+            self.refresh()
+
+    def read_slot(self, slot):
+        offset = self.slots_offset + slot * SLOT_SIZE
+        last = None
+        while True:
+            seq = SEQ.unpack_from(self.map, offset)[0]
+            if seq & 1:
+                # only a writer that stopped mid write keeps the same odd
+                # sequence number for long
+                if seq != last:
+                    last = seq
+                    deadline = time.monotonic() + STUCK_TIMEOUT
+                elif time.monotonic() > deadline:
+                    return None
+                # let a writer in this process finish
+                time.sleep(0)
+                continue
+            price, trade_time, delta = VALUES.unpack_from(
+                self.map, offset + SEQ.size)
+            if SEQ.unpack_from(self.map, offset)[0] == seq:
+                if seq == 0:
+                    return None
+                return price, trade_time, delta, seq
+
+    def symbols(self):
+        self.refresh()
+        return list(self.index)
+
+    def to_price_data(self):
+        """Get the latest trades in the price data file format."""
+        price_data = {}
+        for symbol in self.symbols():
+            value = self.get(symbol)
+            if value is not None:
+                price, trade_time, delta, _ = value
+                price_data[symbol] = {
+                    'price': price,
+                    'time': trade_time,
+                    'delta': delta,
+                }
+
+        return price_data
+
+
+def read_price_data(filename=DEFAULT_BOARD_FILE):
+    """Get the latest trades from a price board, or None if there is no
+       board."""
+    try:
+        with PriceBoard(filename) as board:
+            return board.to_price_data()
+    except (OSError, ValueError):
+        return None
+
+
+def parse_args():
+    """Parse commandline options."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('symbols', nargs='*',
+                        help='Symbols to show, all if none are given')
+    parser.add_argument('--board-file', '-b', default=DEFAULT_BOARD_FILE,
+                        help='Price board file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with PriceBoard(args.board_file) as board:
+        for symbol in args.symbols or sorted(board.symbols()):
+            value = board.get(symbol)
+            if value is None:
+                print("{}: no price".format(symbol))
+                continue
+            price, trade_time, delta, seq = value
+            print("{}: {: .3f} {} {: .3f} ({})".format(
+                symbol, price, trade_time, delta, seq))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,36 +4,119 @@
     Copyright 2020 Joe Talbott.
 """
 import argparse
+import atexit
+import csv
 import datetime
 import json
-import requests
+import os
+import sys
+import time
+
+import http_session
+import profiling
+from alerts import (BELOW, DEFAULT_STATE_FILE, AlertEngine,
+                    add_holding_alerts, read_state, write_state)
+from bands import BAND_BASES, DEFAULT_DOWN, DEFAULT_UP, Bands, parse_steps
+from journal import (SNAPSHOT_SEQ_KEY, append_journal, clear_journal,
+                     read_journal)
+from portfolio import Holding, Portfolio, Position
+from profiling import phase
+from providers import (DEFAULT_HEDGE_AFTER, PROVIDERS, QUOTE_CHUNK_SIZE,
+                       QUOTE_MAX_WORKERS, YahooProvider, fetch_hedged,
+                       get_provider)
+from quote_cache import DEFAULT_CACHE_FILE, QuoteCache
+from recorder import DEFAULT_DATA_DIR, DEFAULT_FLUSH_INTERVAL, TickRecorder
+from render import BOLD, ENDC, GREEN, RED, Column, RowFormat
+from shares_cache import load_json
+from tsstore import DEFAULT_STORE_DIR, ColumnStore
 # from pprint import pprint
 
-API_ENDPOINT = (
-    "https://query1.finance.yahoo.com/v7/finance/quote"
-    "?lang=en-US&region=US&corsDomain=finance.yahoo.com"
-)
-
-# Colors
-RED = '\033[31m'
-GREEN = '\033[32m'
-BOLD = '\033[1m'
-ENDC = '\033[0m'
+# Cursor control
+CLEAR_SCREEN = '\033[2J\033[H'
+CLEAR_LINE = '\033[2K'
+MOVE_CURSOR = '\033[{};1H'
 
 DEFAULT_SHARES_FILE = '~/shares.json'
-DATA_FILE='pricer_data.json'
+DEFAULT_WATCH_INTERVAL = 15
+DEFAULT_SCENARIO_PERCENT = [5, 10, 20]
 
 MARKET_STATE_CLOSED = 'c'
 MARKET_STATE_OPEN = ' '
 MARKET_STATE_POST = '*'
 MARKET_STATE_PRE = '*'
 
+# Report row layouts
+BLANK_HEADER = ' ' * 42
+HEADER_FORMAT = RowFormat([
+    Column(string=True, field_width=7, color=False, bold=False),  # symbol
+    Column(color=False, bold=True),  # price
+    Column(width=9, bold=False),  # change
+    Column(precision=2, percent=True, bold=False),  # change percent
+    Column(string=True, field_width=1, color=False, bold=False),  # state
+])
+OWNED_FORMAT = RowFormat([
+    Column(),  # cost
+    Column(precision=2, percent=True),  # change percent
+    Column(width=8, precision=2),  # shares
+    Column(field_width=11, precision=2),  # gain
+    Column(string=True, field_width=12),  # hold
+])
+VERBOSE_OWNED_FORMAT = RowFormat([
+    Column(),  # cost
+    Column(),  # change
+    Column(precision=2, percent=True),  # change percent
+    Column(width=8, precision=2),  # shares
+    Column(field_width=11, precision=2),  # gain
+    Column(string=True, field_width=12),  # hold
+])
+ALERT_FORMAT = RowFormat([
+    Column(string=True, field_width=1),  # direction
+    Column(width=6, precision=2, field_width=6),  # alert price
+])
+SCENARIO_HEADER = '{:>7s} {:>10s} {:>10s} {:>11s} {:>11s} {:>8s} {:>10s}'
+SCENARIO_FORMAT = RowFormat([
+    Column(string=True, field_width=7, color=False),  # symbol or step
+    Column(color=False),  # price
+    Column(precision=2, percent=True),  # change from the average cost
+    Column(field_width=11, precision=2),  # gain selling all lots
+    Column(field_width=11, precision=2),  # gain selling winning lots
+    Column(width=8, precision=2, color=False),  # remaining shares
+    Column(string=True, color=False),  # remaining average cost
+])
+SCENARIO_TOTAL_FORMAT = RowFormat([
+    Column(string=True, field_width=7, color=False),  # label
+    Column(string=True, color=False),  # no price
+    Column(precision=2, percent=True),  # percent step
+    Column(field_width=11, precision=2),  # gain selling all lots
+    Column(field_width=11, precision=2),  # gain selling winning lots
+    Column(width=8, precision=2, color=False),  # remaining shares
+])
+LOT_FORMAT = RowFormat([
+    Column(string=True, field_width=7, color=False),  # symbol
+    Column(color=False),  # cost
+    Column(width=8, precision=2, color=False),  # shares
+])
+
+
+# quote history recorder, set up by start_recorder()
+recorder = None
+
+
+def start_recorder(args):
+    """Set up the quote history recorder from the commandline options."""
+    global recorder
+
+    if args.no_record:
+        return
+
+    recorder = TickRecorder(args.data_dir,
+                            flush_interval=args.flush_interval)
+    atexit.register(recorder.close)
+
 
 def append_data(data):
-    return
-    with open(DATA_FILE, 'a') as fp:
-        fp.write('\n')
-        json.dump(data, fp)
+    if recorder is not None:
+        recorder.append(data)
 
 
 def color_value(value, color='', percent=False, width=10, precision=4,
@@ -77,71 +160,81 @@ def color_value(value, color='', percent=False, width=10, precision=4,
     return value_str
 
 
-def get_alert_report(symbol, price, share_data, verbose=False, agg=False):
+def get_alert_engine(blocks, hysteresis=0.0):
+    """Index the price alerts of the holdings, owned by their holding."""
+    engine = AlertEngine(hysteresis=hysteresis)
+    for symbol, items in blocks:
+        for item in items:
+            add_holding_alerts(engine, symbol, item, owner=id(item))
+
+    return engine
+
+
+def update_alerts(alerts, prices):
+    """Update the alerts with the current prices, returning the alerts
+       that fired."""
+    fired = []
+    if alerts is not None:
+        for symbol, price in prices.items():
+            fired.extend(alerts.update(symbol, price))
+
+    return fired
+
+
+def load_alert_state(alerts, filename):
+    """Carry the alerts on from the state saved by an earlier run,
+       returning the saved state, or None without a state file or
+       alerts."""
+    if not filename or not len(alerts):
+        return None
+
+    state = read_state(filename)
+    try:
+        alerts.set_state(state)
+    except (AttributeError, TypeError, ValueError):
+        # not a state this version wrote, start over
+        state = {}
+
+    return state
+
+
+def save_alert_state(alerts, state, filename, partial=False):
+    """Save the alert state for the next run.  With partial the engine
+       only has some of the symbols and the others' state is kept."""
+    if state is None:
+        return
+
+    if partial:
+        state = dict(state)
+        state.update(alerts.get_state())
+    else:
+        state = alerts.get_state()
+    write_state(state, filename)
+
+
+def get_alert_report(item, alerts, agg=False):
+    """Show the holding's active price alert, preferring a price_below
+       alert."""
     report = ""
-    symbol_data = share_data
-    alert = symbol_data.get('alert', {})
-    alert_price_above = alert.get('price_above')
-    alert_price_below = alert.get('price_below')
-    alert_price = (alert_price_above is not None or
-                   alert_price_below is not None)
-    hidden = alert.get('hide', False)
-
-    if hidden or not alert_price:
+    if alerts is None:
         return report
 
-    if alert and alert_price and not hidden:
-        alert_price = ''
-        symbol_color = ''
-        direction = ''
-        if alert_price_above is not None and price > alert_price_above:
-            direction = '^'
-            symbol_color = 'green'
-            alert_price = alert_price_above
+    active = alerts.get_active(id(item))
+    if not active:
+        return report
 
-        if alert_price_below is not None and price < alert_price_below:
-            direction = 'v'
-            symbol_color = 'green'
-            alert_price = alert_price_below
-
-        if direction == '':
-            return report
-
-        kwargs = {}
-        if agg:
-            kwargs['bold'] = True
-        report = "{} {}".format(
-            color_value(direction, color=symbol_color, string=True,
-                        field_width=1, **kwargs),
-            color_value(alert_price, color=symbol_color,
-                        precision=2,
-                        width=6,
-                        field_width=6,
-                        **kwargs
-                        ),
-        )
+    alert = max(active, key=lambda x: x.direction == BELOW)
+    report = ALERT_FORMAT.format((alert.direction, alert.price),
+                                 color='green', bold=agg)
 
     return report
 
 
-def get_owned_report(symbol, price, share_data, verbose=False, agg=False,
-                     hold=False, until=None, total_shares=None,
-                     avg_price=None):
+def get_owned_report(valuation, row, verbose=False, agg=False, hold=False,
+                     until=None):
+    """Build the owned shares columns for a lot and the running sum line
+       of the lots before it from the portfolio valuation."""
     sum_line = None
-    symbol_data = share_data
-    cost = symbol_data.get('cost')
-    shares = symbol_data.get('shares')
-    if total_shares is not None and total_shares > 0:
-        if avg_price is not None:
-            avg_price = (
-                (shares * cost + total_shares * avg_price) /
-                (total_shares + shares)
-            )
-    else:
-        avg_price = cost
-        total_shares = 0
-    if shares is not None:
-        total_shares += shares
 
     hold_str = ' '
 
@@ -151,19 +244,17 @@ def get_owned_report(symbol, price, share_data, verbose=False, agg=False,
     if until is not None:
         hold_str = '{} {}'.format(hold_str, until)
 
-    kwargs = {}
-    if agg:
-        kwargs['bold'] = True
-
-    if cost is None or shares is None or shares == 0.0:
+    if row is None or valuation.shares[row] == 0.0:
         # Fake out the column width for alerts
         if verbose:
             owned = ' '*67
         else:
             owned = ' '*57
     else:
-        symbol_change = price - cost
-        sum_symbol_change = price - avg_price
+        cost = valuation.cost[row]
+        shares = valuation.shares[row]
+        symbol_change = valuation.change[row]
+        sum_symbol_change = valuation.running_change[row]
         symbol_color = ''
         sum_symbol_color = ''
 
@@ -177,75 +268,29 @@ def get_owned_report(symbol, price, share_data, verbose=False, agg=False,
         elif sum_symbol_change > 0.0:
             sum_symbol_color = 'green'
 
-        symbol_change_percent = symbol_change / cost * 100
-        sum_symbol_change_percent = sum_symbol_change / avg_price * 100
-
         if verbose:
-            owned = "{} {} {} {} {} {}".format(
-                color_value(cost, color=symbol_color, **kwargs),
-                color_value(symbol_change, color=symbol_color, **kwargs),
-                color_value(symbol_change_percent,
-                            color=symbol_color,
-                            precision=2,
-                            field_width=10,
-                            percent=True, **kwargs),
-                color_value(shares, color=symbol_color,
-                            precision=2, width=8, **kwargs),
-                color_value(shares * symbol_change,
-                            field_width=11, precision=2,
-                            color=symbol_color, **kwargs),
-                color_value(hold_str, field_width=12, string=True,
-                            color=symbol_color, **kwargs),
-            )
-            sum_line = "{} {} {} {} {} {}".format(
-                color_value(cost, color=sum_symbol_color, bold=True),
-                color_value(symbol_change, color=sum_symbol_color, bold=True),
-                color_value(sum_symbol_change_percent,
-                            color=sum_symbol_color,
-                            precision=2,
-                            field_width=10,
-                            percent=True, bold=True),
-                color_value(total_shares, color=sum_symbol_color,
-                            precision=2, width=8, bold=True),
-                color_value(total_shares * sum_symbol_change,
-                            field_width=11, precision=2,
-                            color=sum_symbol_color, bold=True),
-                color_value(hold_str, field_width=12, string=True,
-                            color=sum_symbol_color, bold=True),
-            )
+            owned = VERBOSE_OWNED_FORMAT.format(
+                (cost, symbol_change, valuation.percent[row], shares,
+                 valuation.gain[row], hold_str),
+                color=symbol_color, bold=agg)
+            sum_line = VERBOSE_OWNED_FORMAT.format(
+                (valuation.running_avg[row], sum_symbol_change,
+                 valuation.running_percent[row],
+                 valuation.running_shares[row], valuation.running_gain[row],
+                 hold_str),
+                color=sum_symbol_color, bold=True)
         else:
-            owned = "{} {} {} {} {}".format(
-                color_value(cost, color=symbol_color, **kwargs),
-                color_value(symbol_change_percent,
-                            color=symbol_color,
-                            precision=2,
-                            field_width=10,
-                            percent=True, **kwargs),
-                color_value(shares, color=symbol_color,
-                            precision=2, width=8, **kwargs),
-                color_value(shares * symbol_change,
-                            field_width=11, precision=2,
-                            color=symbol_color, **kwargs),
-                color_value(hold_str, field_width=12, string=True,
-                            color=symbol_color, **kwargs),
-            )
-            sum_line = "{} {} {} {} {}".format(
-                color_value(avg_price, color=sum_symbol_color, bold=True),
-                color_value(sum_symbol_change_percent,
-                            color=sum_symbol_color,
-                            precision=2,
-                            field_width=10,
-                            percent=True, bold=True),
-                color_value(total_shares, color=sum_symbol_color,
-                            precision=2, width=8, bold=True),
-                color_value(total_shares * sum_symbol_change,
-                            field_width=11, precision=2,
-                            color=sum_symbol_color, bold=True),
-                color_value(hold_str, field_width=12, string=True,
-                            color=sum_symbol_color, bold=True),
-            )
-
-    return owned, total_shares, avg_price, sum_line
+            owned = OWNED_FORMAT.format(
+                (cost, valuation.percent[row], shares, valuation.gain[row],
+                 hold_str),
+                color=symbol_color, bold=agg)
+            sum_line = OWNED_FORMAT.format(
+                (valuation.running_avg[row], valuation.running_percent[row],
+                 valuation.running_shares[row], valuation.running_gain[row],
+                 hold_str),
+                color=sum_symbol_color, bold=True)
+
+    return owned, sum_line
 
 
 def get_price_data(market_state, symbol_data):
@@ -292,437 +337,812 @@ def get_price_data(market_state, symbol_data):
 
 
 def get_market_data(data, symbol):
-    for item in data:
-        if item.get('symbol') == symbol:
-            return item
-    return None
+    """Get the quote record for a symbol from the symbol keyed quotes."""
+    return data.get(symbol)
+
+
+def get_quotes(symbols, provider, fallback=None,
+               hedge_after=DEFAULT_HEDGE_AFTER, cache=None, offline=False):
+    """Get the quote records for the given symbols keyed by symbol.
+
+       Fresh quotes from the cache are used instead of fetching them and in
+       offline mode only cached quotes are returned.  The rest come from
+       the provider, hedged with the fallback provider if there is one."""
+    symbols = sorted(set(symbols))
+    quotes = {}
+    if cache is not None:
+        quotes, symbols = cache.split(symbols, offline=offline)
+    if offline:
+        if symbols:
+            print("no cached quotes for {}".format(' '.join(symbols)),
+                  file=sys.stderr)
+        return quotes
+    if not symbols:
+        return quotes
+
+    fetched = fetch_hedged(symbols, provider, fallback,
+                           hedge_after=hedge_after)
+    quotes.update(fetched)
+
+    if cache is not None:
+        for symbol, quote in fetched.items():
+            cache.put(symbol, quote)
+        cache.save()
+
+    return quotes
+
+
+def get_holding_blocks(share_data):
+    """Group consecutive visible holdings of the same symbol.
+
+       Returns a list of (symbol, holdings) tuples in share data order."""
+    blocks = []
+    for item in share_data:
+        if item.get('hide', False):
+            continue
+        symbol = item['name'].upper()
+        if blocks and blocks[-1][0] == symbol:
+            blocks[-1][1].append(item)
+        else:
+            blocks.append((symbol, [item]))
 
+    return blocks
 
-def get_current_price(symbols=None, shares_file=DEFAULT_SHARES_FILE,
-                      verbose=False):
-    all_share_data = get_share_data(shares_file)
-    share_data = all_share_data.get('own')
-    data_file = "pricer.dat"
-    data_record = {}
-    try:
-        # with open(data_file) as fp:
-        #     data_record = json.load(fp)
-        pass
-    except IOError:
-        pass
 
-    if symbols is None:
-        symbols = list(set(x['name'] for x in share_data))
-
-    string_fields = [
-        'symbol',
-        'marketState',
-        'regularMarketPrice',
-    ]
-    float_fields = [
-        'regularMarketChange',
-        'regularMarketChangePercent',
-        'preMarketPrice',
-        'preMarketChange',
-        'preMarketChangePercent',
-        'postMarketPrice',
-        'postMarketChange',
-        'postMarketChangePercent',
-    ]
-    fields = string_fields + float_fields
-    result = requests.get(
-        API_ENDPOINT,
-        params={
-            'symbols': ','.join(symbols),
-            'fields': ','.join(fields),
-        },
-        headers={
-            'User-Agent': '',
-        },
+def get_market_time(market_data):
+    """Get a key that changes whenever a symbol's quote changes."""
+    return (
+        market_data.get('marketState'),
+        market_data.get('regularMarketTime'),
+        market_data.get('preMarketTime'),
+        market_data.get('postMarketTime'),
     )
-    if result.status_code == 200:
-        data = result.json()
-
-        response = data.get('quoteResponse')
-        if response is not None:
-            data = response
-
-        data_result = data.get('result')
-        data_error = data.get('error')
-        if data_error is not None:
-            print("data_error: {}".format(data_error))
-        if data_result is not None:
-            data = data_result
-
-        symbols_seen = []
-        last_symbol = None
-        last_symbol_count = 0
-        sum_line = None
-        for item in share_data:
-            symbol = item['name'].upper()
-            hide = item.get('hide', False)
-            agg = item.get('agg', False)
-            hold = item.get('hold', False)
-            until = item.get('until')
-            alias = item.get('alias')
-            skip_record = item.get('skip_record', True)
-            positions = item.get('positions', [])
-            if until is not None:
-                hold = True
-            if hide:
-                continue
-            market_data = get_market_data(data, symbol)
-            if market_data is None:
-                print(f"JOE: found no data for {symbol}")
-
-            market_state = market_data.get('marketState')
-            if symbol != 'ES=F' and market_state not in ['PREPRE', 'POSTPOST', 'CLOSED']:
-                append_data(market_data)
-            # print("JOE: market_state: {}".format(market_state))
-            # pprint(market_data)
-            state = market_data.get('marketState')
-            price = float(market_data.get('regularMarketPrice', 0.0))
-            change = float(market_data.get('regularMarketChange', 0.0))
-            percent = float(market_data.get('regularMarketChangePercent', 0.0))
-            record_time = market_data.get('regularMarketTime')
-            record_type = "regular"
-            if state == 'PRE':
-                price = float(market_data.get('preMarketPrice', market_data.get('regularMarketPrice')))
-                change = float(market_data.get('preMarketChange', market_data.get('regularMarketChange')))
-                percent = float(market_data.get('preMarketChangePercent', market_data.get('regularMarketChangePercent')))
-                record_time = market_data.get('preMarketTime')
-                record_type = "pre"
-            elif state == 'POST':
-                price = float(market_data.get('postMarketPrice', market_data.get('regularMarketPrice')))
-                change = float(market_data.get('postMarketChange', market_data.get('regularMarketChange')))
-                percent = float(market_data.get('postMarketChangePercent', market_data.get('regularMarketChangePercent')))
-                record_time = market_data.get('postMarketTime')
-                record_type = "post"
-            symbol_data = data_record.setdefault(symbol, {})
-            symbol_price_data =  {
-                "price": price,
-                "change": change,
-                "percent": percent,
-                "market_state": market_state,
-                "type": record_type,
-            }
-            if not skip_record:
-                if record_time is not None and record_time != "null":
-                    symbol_data[record_time] = symbol_price_data
 
-            price, change, percent, market_state_str = get_price_data(
-                market_state, market_data)
-
-            color = ''
-            if change < 0:
-                color = 'red'
-            elif change > 0.0:
-                color = 'green'
-
-            change = color_value(change, color=color, width=9)
-            percent = color_value(percent, color=color, precision=2,
-                                  field_width=10,
-                                  percent=True)
-            price_str = color_value(price, precision=4, bold=True)
-            sym = symbol
-            if alias is not None:
-                sym = alias
-            line = "{:>7s} {} {} {} {:>1s}".format(
-                sym, price_str, change, percent, market_state_str)
-
-            if symbol in symbols_seen and last_symbol == symbol:
-                line = "{:>42s}".format("")
-            else:
-                symbols_seen.append(symbol)
-
-            if symbol == last_symbol:
-                last_symbol_count += 1
-            else:
-                total_shares = None
-                avg_price = None
-                if sum_line is not None and last_symbol_count > 0:
-                    sum_line = "{} {}".format("{:>42s}".format(""), sum_line)
-                    print(sum_line)
-                last_symbol_count = 0
-                sum_line = None
-            last_symbol = symbol
-
-            # Add user's owned shares info
-            positions = [x for x in positions if not x.get('hide', False)]
-            if positions:
-                index = 0
-                non_hidden_positions = 0
-                show_alert = False
-                for position in positions:
-                    if index != 0:
-                        line = "{:>42s}".format("")
-                    share_data = position
-                    if share_data.get('hide', False):
-                        continue
-                    non_hidden_positions += 1
-                    until = share_data.get('until')
-                    hold = share_data.get('hold', False)
-                    if until is not None:
-                        hold = True
-
-                    owned, total_shares, avg_price, sum_line = get_owned_report(
-                        symbol, price, share_data,
-                        verbose=verbose, agg=agg, hold=hold,
-                        until=until,
-                        total_shares=total_shares, avg_price=avg_price
-                    )
-
-                    if owned:
-                        line = "{} {}".format(line, owned)
-
-                    if not show_alert:
-                        alert = get_alert_report(symbol, price, item,
-                                                verbose=verbose, agg=agg)
-
-                        if alert:
-                            line = "{} {}".format(line, alert)
-                            show_alert = True
-                    print(line)
-                    index += 1
-                if (
-                    sum_line is not None and
-                    len(positions) > 1 and
-                    non_hidden_positions > 1
-                ):
-                    sum_line = "{} {}".format("{:>42s}".format(""), sum_line)
-                    print(sum_line)
-            else:
-                share_data = item
-                owned, total_shares, avg_price, sum_line = get_owned_report(
-                    symbol, price, share_data,
-                    verbose=verbose, agg=agg, hold=hold,
-                    until=until,
-                    total_shares=total_shares, avg_price=avg_price
-                )
-
-                alert = get_alert_report(symbol, price, item,
-                                         verbose=verbose, agg=agg)
+
+def record_market_data(symbol, items, market_data, store=None):
+    """Record the symbol's current quote data."""
+    market_state = market_data.get('marketState')
+    if symbol != 'ES=F' and market_state not in ['PREPRE', 'POSTPOST', 'CLOSED']:
+        append_data(market_data)
+    # print("JOE: market_state: {}".format(market_state))
+    # pprint(market_data)
+    state = market_data.get('marketState')
+    price = float(market_data.get('regularMarketPrice', 0.0))
+    change = float(market_data.get('regularMarketChange', 0.0))
+    percent = float(market_data.get('regularMarketChangePercent', 0.0))
+    record_time = market_data.get('regularMarketTime')
+    record_type = "regular"
+    if state == 'PRE':
+        price = float(market_data.get('preMarketPrice', market_data.get('regularMarketPrice')))
+        change = float(market_data.get('preMarketChange', market_data.get('regularMarketChange')))
+        percent = float(market_data.get('preMarketChangePercent', market_data.get('regularMarketChangePercent')))
+        record_time = market_data.get('preMarketTime')
+        record_type = "pre"
+    elif state == 'POST':
+        price = float(market_data.get('postMarketPrice', market_data.get('regularMarketPrice')))
+        change = float(market_data.get('postMarketChange', market_data.get('regularMarketChange')))
+        percent = float(market_data.get('postMarketChangePercent', market_data.get('regularMarketChangePercent')))
+        record_time = market_data.get('postMarketTime')
+        record_type = "post"
+    skip_record = all(item.get('skip_record', True) for item in items)
+    if not skip_record and store is not None:
+        if record_time is not None and record_time != "null":
+            store.append(symbol, record_time, price, change, percent,
+                         market_state, record_type)
+
+
+def get_symbol_report(symbol, items, market_data, valuation, block_rows,
+                      verbose=False, bands=None, alerts=None):
+    """Build the report lines for one symbol's consecutive holdings.
+
+       valuation must already hold the symbol's current price and
+       block_rows are the holdings' lot rows in the valuation.  Price bands
+       are added to the symbol's first line or to every lot's line and the
+       holdings' active alerts are taken from the alert engine."""
+    lines = []
+    market_state = market_data.get('marketState')
+    price, change, percent, market_state_str = get_price_data(
+        market_state, market_data)
+
+    color = ''
+    if change < 0:
+        color = 'red'
+    elif change > 0.0:
+        color = 'green'
+
+    sum_line = None
+    sum_line_shown = False
+    for item_index, item in enumerate(items):
+        agg = item.get('agg', False)
+        hold = item.get('hold', False)
+        until = item.get('until')
+        alias = item.get('alias')
+        positions = item.get('positions', [])
+        rows = block_rows[item_index]
+        if until is not None:
+            hold = True
+
+        sym = symbol
+        if alias is not None:
+            sym = alias
+        if item_index == 0:
+            line = HEADER_FORMAT.format(
+                (sym, price, change, percent, market_state_str), color=color)
+        else:
+            line = BLANK_HEADER
+
+        # Add user's owned shares info
+        positions = [x for x in positions if not x.get('hide', False)]
+        sum_line_shown = False
+        if positions:
+            show_alert = False
+            for index, position in enumerate(positions):
+                if index != 0:
+                    line = BLANK_HEADER
+                until = position.get('until')
+                hold = position.get('hold', False)
+                if until is not None:
+                    hold = True
+
+                owned, sum_line = get_owned_report(
+                    valuation, rows[index], verbose=verbose, agg=agg,
+                    hold=hold, until=until)
 
                 if owned:
                     line = "{} {}".format(line, owned)
 
-                if alert:
-                    line = "{} {}".format(line, alert)
-                print(line)
+                if not show_alert:
+                    alert = get_alert_report(item, alerts, agg=agg)
+
+                    if alert:
+                        line = "{} {}".format(line, alert)
+                        show_alert = True
+                line = add_cost_bands(line, bands, valuation, rows[index])
+                lines.append(line)
+            if sum_line is not None and len(positions) > 1:
+                lines.append("{} {}".format(BLANK_HEADER, sum_line))
+                sum_line_shown = True
+        else:
+            owned, sum_line = get_owned_report(
+                valuation, rows[0], verbose=verbose, agg=agg, hold=hold,
+                until=until)
 
-    # with open(data_file, 'w') as fp:
-    #     json.dump(data_record, fp)
+            alert = get_alert_report(item, alerts, agg=agg)
 
+            if owned:
+                line = "{} {}".format(line, owned)
 
-def query_one(args):
-    get_current_price(symbols=[args.symbol], shares_file=args.shares_file,
-                      verbose=args.verbose)
+            if alert:
+                line = "{} {}".format(line, alert)
+            line = add_cost_bands(line, bands, valuation, rows[0])
+            lines.append(line)
 
+    # Show the totals across all of the symbol's holdings
+    if sum_line is not None and len(items) > 1 and not sum_line_shown:
+        lines.append("{} {}".format(BLANK_HEADER, sum_line))
 
-def query_all(args):
-    get_current_price(shares_file=args.shares_file,
-                      verbose=args.verbose)
+    if bands is not None and bands.base == 'price' and lines:
+        lines[0] = "{} {}".format(lines[0], bands.format(price))
 
+    return lines
 
-def remove(args):
-    print("Removing position at index (0 index)")
 
-    all_share_data = get_share_data(args.shares_file)
-    share_data = all_share_data.get('own')
-    sold_data = all_share_data.setdefault('sold', {})
+def add_cost_bands(line, bands, valuation, row):
+    """Add the price bands from a lot's cost to its line."""
+    if bands is None or bands.base != 'cost' or row is None:
+        return line
 
-    symbol = args.symbol.lower()
-    index = args.index
+    return "{} {}".format(line, bands.format(valuation.cost[row]))
 
-    for item in share_data:
-        if item['name'].lower() == symbol:
-            print("Found {}".format(symbol))
-            if len(item['positions']) < index:
-                print("Invalid position")
-                return
-
-            # skip hidden entries
-            while item['positions'][index].get('hide', False):
-                index += 1
+
+def get_prices(data):
+    """Get the displayed price for each symbol's quote."""
+    prices = {}
+    for symbol, market_data in data.items():
+        price, _, _, _ = get_price_data(market_data.get('marketState'),
+                                        market_data)
+        prices[symbol] = price
+
+    return prices
+
+
+def get_current_price(symbols=None, shares_file=DEFAULT_SHARES_FILE,
+                      verbose=False, provider=None, fallback=None,
+                      hedge_after=DEFAULT_HEDGE_AFTER, cache=None,
+                      offline=False, store=None, bands=None,
+                      alert_hysteresis=0.0, alert_state_file=None):
+    partial = symbols is not None
+    with phase('load'):
+        all_share_data = get_share_data(shares_file)
+        share_data = all_share_data.get('own')
+
+        blocks = get_holding_blocks(share_data)
+        if symbols is not None:
+            blocks = [x for x in blocks if x[0] in symbols]
+        else:
+            symbols = [symbol for symbol, _ in blocks]
+
+    if provider is None:
+        provider = YahooProvider()
+    with phase('fetch'):
+        data = get_quotes(symbols, provider, fallback=fallback,
+                          hedge_after=hedge_after, cache=cache,
+                          offline=offline)
+    with phase('value'):
+        from valuation import Valuation
+
+        prices = get_prices(data)
+        valuation = Valuation(blocks)
+        valuation.set_prices(prices)
+    with phase('alerts'):
+        alerts = get_alert_engine(blocks, hysteresis=alert_hysteresis)
+        alert_state = load_alert_state(alerts, alert_state_file)
+        update_alerts(alerts, prices)
+        save_alert_state(alerts, alert_state, alert_state_file,
+                         partial=partial)
+    lines = []
+    if data:
+        for index, (symbol, items) in enumerate(blocks):
+            market_data = get_market_data(data, symbol)
+            if market_data is None:
+                lines.append(f"JOE: found no data for {symbol}")
                 continue
 
-            item['positions'][index]['hide'] = True
-            item['positions'][index]['note'] = (
-                "Deleted automatically ({})".format(datetime.datetime.now())
-            )
+            with phase('record'):
+                record_market_data(symbol, items, market_data, store=store)
+            with phase('report'):
+                lines.extend(get_symbol_report(symbol, items, market_data,
+                                               valuation,
+                                               valuation.block_rows[index],
+                                               verbose=verbose, bands=bands,
+                                               alerts=alerts))
 
-            sold_data.get(item['name'], []).append(item['positions'][index])
-            del(item['positions'][index])
+    # write the whole report at once
+    with phase('output'):
+        if lines:
+            sys.stdout.write('\n'.join(lines))
+            sys.stdout.write('\n')
 
-    set_share_data(args.shares_file, all_share_data)
+    if store is not None:
+        with phase('record'):
+            store.flush()
 
 
-def until(args):
-    print("Adding until")
+def draw_lines(previous, lines):
+    """Redraw only the screen rows that differ from the previous frame.
 
-    all_share_data = get_share_data(args.shares_file)
-    share_data = all_share_data.get('own')
+       A frame taller than the terminal scrolls it, so screen rows no longer
+       match report lines and the whole frame is drawn again instead."""
+    import shutil
 
-    symbol = args.symbol.lower()
-    index = args.index
-    until = args.until
+    height = shutil.get_terminal_size().lines
+    out = []
+    if (
+        previous is None or
+        max(len(previous), len(lines)) >= height
+    ):
+        out.append(CLEAR_SCREEN)
+        out.extend("{}\n".format(line) for line in lines)
+    else:
+        for row, line in enumerate(lines):
+            if row >= len(previous) or previous[row] != line:
+                out.append(MOVE_CURSOR.format(row + 1))
+                out.append("{}{}".format(CLEAR_LINE, line))
+        for row in range(len(lines), len(previous)):
+            out.append(MOVE_CURSOR.format(row + 1))
+            out.append(CLEAR_LINE)
+        out.append(MOVE_CURSOR.format(len(lines) + 1))
 
-    for item in share_data:
-        if item['name'].lower() == symbol:
-            print("Found {}".format(symbol))
-            if len(item['positions']) < index:
-                print("Invalid position")
-                return
-
-            # skip hidden entries
-            while item['positions'][index].get('hide', False):
-                index += 1
-                continue
+    sys.stdout.write(''.join(out))
+    sys.stdout.flush()
 
-            item['positions'][index]['until'] = until
 
-    set_share_data(args.shares_file, all_share_data)
+def configure_session(args):
+    """Set up the shared HTTP session from the commandline options."""
+    http_session.configure_session(pool_size=args.pool_size,
+                                   retries=args.retries,
+                                   timeout=args.timeout)
 
 
-def deuntil(args):
-    print("Removing until")
+def get_quote_cache(args):
+    """Get the quote cache selected by the commandline options."""
+    if args.no_cache and not args.offline:
+        return None
 
-    all_share_data = get_share_data(args.shares_file)
-    share_data = all_share_data.get('own')
+    provider = args.provider
+    if args.fallback is not None and args.fallback != args.provider:
+        # hedged quotes come from either provider
+        provider = '{}+{}'.format(args.provider, args.fallback)
 
-    symbol = args.symbol.lower()
-    index = args.index
+    return QuoteCache(args.cache_file, provider=provider)
 
-    for item in share_data:
-        if item['name'].lower() == symbol:
-            print("Found {}".format(symbol))
-            if len(item['positions']) < index:
-                print("Invalid position")
-                return
-
-            # skip hidden entries
-            while item['positions'][index].get('hide', False):
-                index += 1
-                continue
 
-            if item['positions'][index].get('until') is not None:
-                del(item['positions'][index]['until'])
+def get_providers(args):
+    """Get the quote provider and fallback provider for the options."""
+    provider = get_provider(args.provider, chunk_size=args.chunk_size,
+                            max_workers=args.workers)
+    fallback = None
+    if args.fallback is not None and args.fallback != args.provider:
+        fallback = get_provider(args.fallback, chunk_size=args.chunk_size,
+                                max_workers=args.workers)
 
-            if index == -1:
-                for i, _ in enumerate(item['positions']):
-                    if item['positions'][i].get('until') is not None:
-                        del(item['positions'][i]['until'])
+    return provider, fallback
 
-    set_share_data(args.shares_file, all_share_data)
 
+def get_bands(args):
+    """Get the price bands to show, if any."""
+    if not args.bands:
+        return None
 
-def add(args):
-    print("Adding a new position")
+    return Bands(args.up, args.down, base=args.bands_from)
+
+
+def query_one(args):
+    with phase('setup'):
+        configure_session(args)
+        start_recorder(args)
+    provider, fallback = get_providers(args)
+    get_current_price(symbols=[args.symbol.upper()],
+                      shares_file=args.shares_file,
+                      verbose=args.verbose, provider=provider,
+                      fallback=fallback, hedge_after=args.hedge_after,
+                      cache=get_quote_cache(args), offline=args.offline,
+                      store=ColumnStore(args.store_dir),
+                      bands=get_bands(args),
+                      alert_hysteresis=args.alert_hysteresis,
+                      alert_state_file=args.alert_state_file)
+
+
+def query_all(args):
+    with phase('setup'):
+        configure_session(args)
+        start_recorder(args)
+    provider, fallback = get_providers(args)
+    get_current_price(shares_file=args.shares_file,
+                      verbose=args.verbose, provider=provider,
+                      fallback=fallback, hedge_after=args.hedge_after,
+                      cache=get_quote_cache(args), offline=args.offline,
+                      store=ColumnStore(args.store_dir),
+                      bands=get_bands(args),
+                      alert_hysteresis=args.alert_hysteresis,
+                      alert_state_file=args.alert_state_file)
+
+
+def watch(args):
+    """Poll the quotes and redraw the rows that changed."""
+    from valuation import Valuation
+
+    with phase('setup'):
+        configure_session(args)
+        start_recorder(args)
     all_share_data = get_share_data(args.shares_file)
-    share_data = all_share_data.get('own')
+    blocks = get_holding_blocks(all_share_data.get('own'))
+    symbols = [symbol for symbol, _ in blocks]
+    provider, fallback = get_providers(args)
+    cache = get_quote_cache(args)
+    store = ColumnStore(args.store_dir)
+    valuation = Valuation(blocks)
+    bands = get_bands(args)
+    alerts = get_alert_engine(blocks, hysteresis=args.alert_hysteresis)
+    alert_state = load_alert_state(alerts, args.alert_state_file)
+
+    # symbol -> (market time, report lines)
+    reports = {}
+    previous = None
+    try:
+        while True:
+            with phase('fetch'):
+                data = get_quotes(symbols, provider, fallback=fallback,
+                                  hedge_after=args.hedge_after, cache=cache,
+                                  offline=args.offline)
+            with phase('value'):
+                prices = get_prices(data)
+                valuation.set_prices(prices)
+            with phase('alerts'):
+                update_alerts(alerts, prices)
+                save_alert_state(alerts, alert_state, args.alert_state_file)
+            lines = []
+            for index, (symbol, items) in enumerate(blocks):
+                market_data = get_market_data(data, symbol)
+                report = reports.get(symbol)
+                if market_data is not None:
+                    with phase('record'):
+                        record_market_data(symbol, items, market_data,
+                                           store=store)
+                    market_time = get_market_time(market_data)
+                    if report is None or report[0] != market_time:
+                        with phase('report'):
+                            report = (market_time, get_symbol_report(
+                                symbol, items, market_data, valuation,
+                                valuation.block_rows[index],
+                                verbose=args.verbose, bands=bands,
+                                alerts=alerts))
+                        reports[symbol] = report
+                if report is not None:
+                    lines.extend(report[1])
+
+            with phase('record'):
+                store.flush()
+            with phase('output'):
+                draw_lines(previous, lines)
+            previous = lines
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+def history(args):
+    """Show the stored quote history for a symbol."""
+    start = end = None
+    if args.start is not None:
+        start = datetime.datetime.fromisoformat(args.start).timestamp()
+    if args.end is not None:
+        end = datetime.datetime.fromisoformat(args.end).timestamp()
 
-    symbol = args.symbol.lower()
-    shares = args.shares
-    cost = args.cost
-    until = args.until
+    store = ColumnStore(args.store_dir)
+    with store.open_series(args.symbol.upper()) as series:
+        for record in series.get_records(start, end):
+            record_time = datetime.datetime.fromtimestamp(record['time'])
+            print("{} {} {} {} {:>8s} {}".format(
+                record_time.isoformat(sep=' '),
+                color_value(record['price'], precision=4),
+                color_value(record['change'], width=9),
+                color_value(record['percent'], precision=2, percent=True),
+                record['market_state'] or '',
+                record['type'] or '',
+            ))
+
+
+def apply_add(portfolio, change):
+    symbol = change['symbol'].lower()
 
     # Add the symbol if it isn't already in the share data
-    if symbol not in [x['name'] for x in share_data]:
-        share_data.append({'name': symbol, 'positions': []})
+    holdings = portfolio.find(symbol)
+    if not holdings:
+        holdings = [portfolio.add_holding(Holding(symbol, positions=[]))]
 
-    for item in share_data:
-        if item['name'].lower() == symbol:
-            datum = {
-                'cost': cost,
-                'shares': shares,
-            }
-            if until is not None:
-                datum['until'] = until
-            item['positions'].append(datum)
-            item['positions'] = sorted(item['positions'], key=lambda r: r['cost'])
-            positions = item['positions']
+    for holding in holdings:
+        holding.add_position(Position(change['cost'], change['shares'],
+                                      until=change.get('until')))
 
-    set_share_data(args.shares_file, all_share_data)
 
+def get_positions(portfolio, change):
+    """Get the (holding, position) pairs a change applies to.
 
-def sub(args):
-    print("Subtracting share from a position")
-    all_share_data = get_share_data(args.shares_file)
-    share_data = all_share_data.get('own')
-    sold_data = all_share_data.setdefault('sold', {})
+       Raises ValueError, before anything is changed, if a holding does not
+       have the position."""
+    return [(holding, holding.get_position(change['index']))
+            for holding in portfolio.get(change['symbol'])]
 
-    symbol = args.symbol.lower()
-    shares = args.shares
-    index = args.index
 
-    # Add the symbol if it isn't already in the share data
-    if symbol not in [x['name'] for x in share_data]:
-        print("ERROR: {} not found".format(symbol))
+def apply_remove(portfolio, change):
+    # a removed position was entered by mistake, not sold
+    for holding, position in get_positions(portfolio, change):
+        holding.remove_position(position)
+
+
+def apply_until(portfolio, change):
+    for _, position in get_positions(portfolio, change):
+        position.until = change['until']
+
+
+def apply_deuntil(portfolio, change):
+    if change['index'] == -1:
+        positions = [x for holding in portfolio.get(change['symbol'])
+                     for x in holding.positions or []]
+    else:
+        positions = [x for _, x in get_positions(portfolio, change)]
+
+    for position in positions:
+        position.until = None
+
+
+def apply_sub(portfolio, change):
+    for holding, position in get_positions(portfolio, change):
+        # XXX: handle incorrect share amounts i.e. > total, negative, etc.
+        position.shares -= change['shares']
+        portfolio.sold.setdefault(holding.name, []).append({
+            'shares': change['shares'],
+            'cost': position.cost,
+            'note': "Removed ({})".format(change['time']),
+        })
+
+
+def apply_increment(portfolio, change):
+    for _, position in get_positions(portfolio, change):
+        # XXX: handle incorrect share amounts i.e. > total, negative, etc.
+        position.shares += change['shares']
+
+
+# change type -> function applying it to the share data
+CHANGES = {
+    'add': apply_add,
+    'remove': apply_remove,
+    'until': apply_until,
+    'deuntil': apply_deuntil,
+    'sub': apply_sub,
+    'increment': apply_increment,
+}
+
+
+# change type -> (field name, type, default) for each field, a default of
+# None means the field is optional and REQUIRED that it must be given
+REQUIRED = object()
+CHANGE_FIELDS = {
+    'add': [('symbol', str, REQUIRED), ('shares', float, REQUIRED),
+            ('cost', float, REQUIRED), ('until', str, None)],
+    'remove': [('symbol', str, REQUIRED), ('index', int, 0)],
+    'until': [('symbol', str, REQUIRED), ('until', str, REQUIRED),
+              ('index', int, 0)],
+    'deuntil': [('symbol', str, REQUIRED), ('index', int, 0)],
+    'sub': [('symbol', str, REQUIRED), ('shares', float, REQUIRED),
+            ('index', int, 0)],
+    'increment': [('symbol', str, REQUIRED), ('shares', float, REQUIRED),
+                  ('index', int, 0)],
+}
+CHANGE_ALIASES = {
+    'rm': 'remove',
+    'du': 'deuntil',
+    'dec': 'sub',
+    'inc': 'increment',
+}
+
+
+def parse_change(record):
+    """Build a change from a record of strings or JSON values, or from a
+       JSON line.
+
+       Raises ValueError for bad JSON, unknown changes and missing or
+       invalid fields."""
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise ValueError("bad JSON: {}".format(e))
+    if not isinstance(record, dict):
+        raise ValueError("not an object: {}".format(json.dumps(record)))
+
+    op = str(record.get('op') or '').strip().lower()
+    op = CHANGE_ALIASES.get(op, op)
+    if op not in CHANGE_FIELDS:
+        raise ValueError("unknown operation '{}'".format(op))
+
+    change = {'op': op}
+    for name, field_type, default in CHANGE_FIELDS[op]:
+        value = record.get(name)
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            if default is REQUIRED:
+                raise ValueError("missing {}".format(name))
+            change[name] = default
+            continue
+        try:
+            change[name] = field_type(value)
+        except (TypeError, ValueError):
+            raise ValueError("invalid {} '{}'".format(name, value))
+
+    return change
+
+
+def read_batch(fp, batch_format=None):
+    """Read the change records from a CSV or JSON lines stream.
+
+       CSV input needs a header row naming the fields.  JSON lines are
+       left for parse_change() to decode, so a bad line is reported like
+       any other invalid change."""
+    lines = [x for x in fp if x.strip() and not x.startswith('#')]
+    if batch_format is None:
+        batch_format = 'csv'
+        if lines and lines[0].lstrip().startswith('{'):
+            batch_format = 'jsonl'
+
+    if batch_format == 'jsonl':
+        return [x.strip() for x in lines]
+
+    return list(csv.DictReader(lines, skipinitialspace=True))
+
+
+def apply_change(portfolio, change):
+    """Apply a change record to the portfolio.
+
+       Raises ValueError if the change does not apply, in which case the
+       portfolio is left as it was."""
+    CHANGES[change['op']](portfolio, change)
+
+
+def change_share_data(args, change):
+    """Apply a change to the user's share data and save it."""
+    change['time'] = str(datetime.datetime.now())
+
+    with phase('load'):
+        portfolio = get_portfolio(args.shares_file)
+    try:
+        with phase('apply'):
+            apply_change(portfolio, change)
+    except ValueError as e:
+        print(e)
         return
 
-    for item in share_data:
-        if item['name'].lower() == symbol:
-            print("Found {}".format(symbol))
-            if len(item['positions']) < index:
-                print("Invalid position")
-                return
-
-            # skip hidden entries
-            while item['positions'][index].get('hide', False):
-                index += 1
-                continue
+    with phase('save'):
+        save_share_data(args.shares_file, portfolio, [change],
+                        journal=args.journal)
 
-            # XXX: handle incorrect share amounts i.e. > total, negative, etc.
-            item['positions'][index]['shares'] -= shares
-            sold_data.setdefault(item['name'], []).append({
-                'shares': shares,
-                'cost': item['positions'][index]['cost'],
-                'note': (
-                    "Removed ({})".format(datetime.datetime.now())
-                ),
-            })
-            item['positions'] = (
-                sorted(item['positions'], key=lambda r: r['cost'])
-            )
-            positions = item['positions']
 
-    set_share_data(args.shares_file, all_share_data)
+def remove(args):
+    print("Removing position at index (0 index)")
+    change_share_data(args, {
+        'op': 'remove',
+        'symbol': args.symbol,
+        'index': args.index,
+    })
 
 
-def increment(args):
-    print("Incrementing shares for a position")
-    all_share_data = get_share_data(args.shares_file)
-    share_data = all_share_data.get('own')
+def until(args):
+    print("Adding until")
+    change_share_data(args, {
+        'op': 'until',
+        'symbol': args.symbol,
+        'index': args.index,
+        'until': args.until,
+    })
 
-    symbol = args.symbol.lower()
-    shares = args.shares
-    index = args.index
 
-    # Add the symbol if it isn't already in the share data
-    if symbol not in [x['name'] for x in share_data]:
-        print("ERROR: {} not found".format(symbol))
-        return
+def deuntil(args):
+    print("Removing until")
+    change_share_data(args, {
+        'op': 'deuntil',
+        'symbol': args.symbol,
+        'index': args.index,
+    })
 
-    for item in share_data:
-        if item['name'].lower() == symbol:
-            print("Found {}".format(symbol))
-            if len(item['positions']) < index:
-                print("Invalid position")
-                return
-
-            # skip hidden entries
-            while item['positions'][index].get('hide', False):
-                index += 1
-                continue
 
-            # XXX: handle incorrect share amounts i.e. > total, negative, etc.
-            item['positions'][index]['shares'] += shares
-            item['positions'] = (
-                sorted(item['positions'], key=lambda r: r['cost'])
-            )
-            positions = item['positions']
+def add(args):
+    print("Adding a new position")
+    change_share_data(args, {
+        'op': 'add',
+        'symbol': args.symbol,
+        'shares': args.shares,
+        'cost': args.cost,
+        'until': args.until,
+    })
+
+
+def sub(args):
+    print("Subtracting share from a position")
+    change_share_data(args, {
+        'op': 'sub',
+        'symbol': args.symbol,
+        'shares': args.shares,
+        'index': args.index,
+    })
+
+
+def increment(args):
+    print("Incrementing shares for a position")
+    change_share_data(args, {
+        'op': 'increment',
+        'symbol': args.symbol,
+        'shares': args.shares,
+        'index': args.index,
+    })
+
+
+def compact(args):
+    """Fold the journal into a new snapshot of the shares file."""
+    print("Compacting the journal")
+    with phase('load'):
+        portfolio = get_portfolio(args.shares_file)
+    with phase('save'):
+        save_share_data(args.shares_file, portfolio, [])
+
+
+def batch(args):
+    """Apply many changes with a single load and save of the shares file."""
+    start = time.perf_counter()
+    with phase('read'):
+        if args.file == '-':
+            records = read_batch(sys.stdin, args.format)
+        else:
+            with open(args.file) as fp:
+                records = read_batch(fp, args.format)
+
+    changes = []
+    errors = 0
+    for count, record in enumerate(records, 1):
+        try:
+            with phase('parse'):
+                changes.append(parse_change(record))
+        except ValueError as e:
+            print("[{}] invalid: {}".format(count, e))
+            errors += 1
+    if errors:
+        print("{} invalid changes, nothing applied".format(errors))
+        return
+
+    now = str(datetime.datetime.now())
+    with phase('load'):
+        portfolio = get_portfolio(args.shares_file)
+    load_time = time.perf_counter()
+
+    applied = []
+    for count, change in enumerate(changes, 1):
+        change['time'] = now
+        change_start = time.perf_counter()
+        try:
+            with phase('apply'):
+                apply_change(portfolio, change)
+        except ValueError as e:
+            result = 'failed: {}'.format(e)
+            errors += 1
+        else:
+            result = 'ok'
+            applied.append(change)
+        elapsed = (time.perf_counter() - change_start) * 1000
+        print("[{}] {} {}: {} ({:.3f} ms)".format(
+            count, change['op'], change['symbol'], result, elapsed))
+
+    if errors and not args.keep_going:
+        print("{} failed changes, nothing saved".format(errors))
+        return
 
-    set_share_data(args.shares_file, all_share_data)
+    apply_time = time.perf_counter()
+    if applied:
+        with phase('save'):
+            save_share_data(args.shares_file, portfolio, applied,
+                            journal=args.journal)
+    end = time.perf_counter()
+
+    print("{} of {} changes applied: load {:.3f} ms, apply {:.3f} ms, "
+          "save {:.3f} ms, total {:.3f} ms".format(
+              len(applied), len(changes),
+              (load_time - start) * 1000, (apply_time - load_time) * 1000,
+              (end - apply_time) * 1000, (end - start) * 1000))
+
+
+def show_bands(args):
+    """Show the price bands of every held symbol or lot."""
+    from valuation import Valuation
+
+    symbols = [x.upper() for x in args.symbols]
+    bands = Bands(args.up, args.down, base=args.bands_from)
+    with phase('load'):
+        blocks = get_holding_blocks(get_share_data(args.shares_file)['own'])
+        if symbols:
+            blocks = [x for x in blocks if x[0] in symbols]
+
+    with phase('value'):
+        valuation = Valuation(blocks)
+
+    if bands.base == 'cost':
+        names = [valuation.symbols[x] for x in valuation.symbol_id]
+        bases = valuation.cost
+    else:
+        configure_session(args)
+        provider, fallback = get_providers(args)
+        with phase('fetch'):
+            data = get_quotes(valuation.symbols, provider, fallback=fallback,
+                              hedge_after=args.hedge_after,
+                              cache=get_quote_cache(args),
+                              offline=args.offline)
+        valuation.set_prices(get_prices(data))
+        names = valuation.symbols
+        bases = valuation.prices
+
+    with phase('bands'):
+        ups, downs = bands.get_ladders(bases)
+
+    lines = ['{:>7s} {:>10s} {}'.format('', bands.base, bands.get_header())]
+    for name, base, up, down in zip(names, bases, ups, downs):
+        if base != base:
+            lines.append("{:>7s} no price".format(name))
+            continue
+        lines.append('{:>7s} {:10.4f} {} {}'.format(
+            name, base, bands.up_format.format(up, color='green'),
+            bands.down_format.format(down, color='red')))
+
+    sys.stdout.write('\n'.join(lines))
+    sys.stdout.write('\n')
 
 
 def check(args):
@@ -732,27 +1152,138 @@ def check(args):
     print(diff)
 
 
-def check_sell(args):
-    """Check the return for selling a given stock at a given price based
-       on current holdings."""
-    all_share_data = get_share_data(args.shares_file)
-    share_data = all_share_data.get('own')
-    ret = None
+def parse_levels(values):
+    """Parse SYMBOL=PRICE,PRICE,... price levels into a dict."""
+    levels = {}
+    for value in values or []:
+        symbol, _, prices = value.partition('=')
+        try:
+            levels[symbol.upper()] = [float(x) for x in prices.split(',')]
+        except ValueError:
+            raise ValueError("invalid price levels '{}'".format(value))
 
-    for item in share_data:
-        symbol = item.get('symbol')
-        if symbol is not None:
-            symbol = symbol.lower()
+    return levels
 
-        if symbol is not None and symbol == args.symbol.lower():
-            cost = item.get('cost', 0.0)
-            shares = item.get('shares', 0.0)
 
-            ret = shares * (args.price - cost)
-            break
+def get_scenarios(args, symbols=None, levels=None, steps=()):
+    """Value selling the lots of the given symbols, or all symbols, at
+       the price levels or percent steps from the current prices."""
+    from scenario import Scenarios, build_grid
+    from valuation import Valuation
 
-    if ret is not None:
-        print(ret)
+    levels = levels or {}
+    with phase('load'):
+        blocks = get_holding_blocks(get_share_data(args.shares_file)['own'])
+        if symbols:
+            blocks = [x for x in blocks if x[0] in symbols]
+
+    with phase('value'):
+        valuation = Valuation(blocks)
+
+    prices = None
+    missing = [x for x in valuation.symbols if x not in levels]
+    if missing and steps:
+        configure_session(args)
+        provider, fallback = get_providers(args)
+        with phase('fetch'):
+            data = get_quotes(missing, provider, fallback=fallback,
+                              hedge_after=args.hedge_after,
+                              cache=get_quote_cache(args),
+                              offline=args.offline)
+        valuation.set_prices(get_prices(data))
+        prices = valuation.prices
+
+    with phase('scenario'):
+        grid = build_grid(len(valuation.symbols),
+                          {valuation.symbol_index[k]: v
+                           for k, v in levels.items()
+                           if k in valuation.symbol_index},
+                          prices=prices, steps=steps)
+        return Scenarios(valuation, grid)
+
+
+def get_gain_color(value):
+    if value < 0.0:
+        return 'red'
+    elif value > 0.0:
+        return 'green'
+
+    return ''
+
+
+def scenario(args):
+    """Show the gains of selling lots over a grid of prices per symbol."""
+    import numpy as np
+
+    from scenario import get_percent_steps
+
+    try:
+        levels = parse_levels(args.level)
+    except ValueError as e:
+        print(e)
+        return
+    symbols = [x.upper() for x in args.symbols]
+    steps = get_percent_steps(args.percent)
+    scenarios = get_scenarios(args, symbols=symbols, levels=levels,
+                              steps=steps)
+    valuation = scenarios.valuation
+
+    lines = [SCENARIO_HEADER.format('', 'price', 'vs avg', 'sell all',
+                                    'sell gains', 'left', 'left avg')]
+    for sid, symbol in enumerate(valuation.symbols):
+        grid = scenarios.grid[sid]
+        if valuation.symbol_shares[sid] == 0.0:
+            continue
+        if np.isnan(grid).all():
+            lines.append("{:>7s} no price".format(symbol))
+            continue
+        avg = valuation.symbol_avg[sid]
+        for point, price in enumerate(grid):
+            if np.isnan(price):
+                continue
+            gain = scenarios.winner_gain[sid, point]
+            remaining_avg = scenarios.winner_remaining_avg[sid, point]
+            lines.append(SCENARIO_FORMAT.format(
+                (symbol if point == 0 else '', price,
+                 (price - avg) / avg * 100, scenarios.all_gain[sid, point],
+                 gain, scenarios.winner_remaining_shares[sid, point],
+                 '' if np.isnan(remaining_avg)
+                 else '{:.4f}'.format(remaining_avg)),
+                color=get_gain_color(gain)))
+
+        if args.lots:
+            for row in np.flatnonzero(valuation.symbol_id == sid):
+                lines.append(LOT_FORMAT.format(
+                    ('', valuation.cost[row], valuation.shares[row])) +
+                    ' ' + ' '.join(
+                        color_value(x, color=get_gain_color(x), precision=2)
+                        for x in scenarios.lot_gain[row] if not np.isnan(x)))
+
+    if not levels:
+        for point, step in enumerate(steps):
+            gain = scenarios.total_winner_gain[point]
+            lines.append(SCENARIO_TOTAL_FORMAT.format(
+                ('TOTAL' if point == 0 else '', '', step,
+                 scenarios.total_all_gain[point], gain,
+                 scenarios.total_remaining_shares[point]),
+                color=get_gain_color(gain), bold=True))
+
+    sys.stdout.write('\n'.join(lines))
+    sys.stdout.write('\n')
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(scenarios.to_dict(), fp, indent=4)
+
+
+def check_sell(args):
+    """Check the return for selling a given stock at a given price based
+       on current holdings."""
+    symbol = args.symbol.upper()
+    scenarios = get_scenarios(args, symbols=[symbol],
+                              levels={symbol: [args.price]})
+    if scenarios.valuation.symbols:
+        print(scenarios.all_gain[0, 0])
 
 
 def parse_args():
@@ -764,6 +1295,71 @@ def parse_args():
     parser.add_argument('--verbose', '-v', action='store_true',
                         default=False,
                         help='Show more data')
+    parser.add_argument('--provider', choices=PROVIDERS, default='yahoo',
+                        help='Quote provider')
+    parser.add_argument('--fallback', choices=PROVIDERS,
+                        help='Quote provider to hedge slow or failed '
+                             'requests with')
+    parser.add_argument('--hedge-after', type=float,
+                        default=DEFAULT_HEDGE_AFTER,
+                        help='Seconds to wait for the quote provider before '
+                             'also asking the fallback provider')
+    parser.add_argument('--chunk-size', type=int, default=QUOTE_CHUNK_SIZE,
+                        help='Maximum number of symbols per quote request')
+    parser.add_argument('--workers', type=int, default=QUOTE_MAX_WORKERS,
+                        help='Maximum number of concurrent quote requests')
+    parser.add_argument('--pool-size', type=int,
+                        default=http_session.DEFAULT_POOL_SIZE,
+                        help='Maximum number of pooled HTTP connections')
+    parser.add_argument('--retries', type=int,
+                        default=http_session.DEFAULT_RETRIES,
+                        help='Number of retries for failed HTTP requests')
+    parser.add_argument('--timeout', type=float,
+                        default=http_session.DEFAULT_TIMEOUT[1],
+                        help='HTTP request timeout in seconds')
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE,
+                        help='JSON quote cache file')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='Always fetch fresh quotes')
+    parser.add_argument('--offline', action='store_true', default=False,
+                        help='Only show cached quotes')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR,
+                        help='Directory for the recorded quote history')
+    parser.add_argument('--no-record', action='store_true', default=False,
+                        help='Do not record the quote history')
+    parser.add_argument('--flush-interval', type=float,
+                        default=DEFAULT_FLUSH_INTERVAL,
+                        help='Seconds between quote history writes')
+    parser.add_argument('--journal', action='store_true', default=False,
+                        help='Journal share changes instead of rewriting '
+                             'the shares file')
+    parser.add_argument('--store-dir', default=DEFAULT_STORE_DIR,
+                        help='Directory for the columnar quote store')
+    parser.add_argument('--bands', action='store_true', default=False,
+                        help='Show price bands in the report')
+    parser.add_argument('--bands-from', choices=BAND_BASES, default='price',
+                        help='Base the price bands on the current price or '
+                             'on each lot\'s cost')
+    parser.add_argument('--up', type=parse_steps, default=DEFAULT_UP,
+                        help='Comma separated percent steps up for the '
+                             'price bands')
+    parser.add_argument('--down', type=parse_steps, default=DEFAULT_DOWN,
+                        help='Comma separated percent steps down for the '
+                             'price bands')
+    parser.add_argument('--alert-hysteresis', type=float, default=0.0,
+                        help='Percent the price has to move back past an '
+                             'alert price before the alert fires again')
+    parser.add_argument('--alert-state-file', default=DEFAULT_STATE_FILE,
+                        help='File keeping the active alerts between runs, '
+                             'empty to turn it off')
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='Write the time spent in each phase to stderr')
+    parser.add_argument('--profile-output',
+                        help='Write the time spent in each phase to a JSON '
+                             'file')
+    parser.add_argument('--cprofile',
+                        help="Run under cProfile and write the stats to a "
+                             "file, or to stderr for '-'")
     parser.set_defaults(func=query_all)
 
     subparsers = parser.add_subparsers(help='sub-commands')
@@ -785,6 +1381,30 @@ def parse_args():
                                     help='Sell price')
     parser_check_stock.set_defaults(func=check_sell)
 
+    parser_scenario = subparsers.add_parser(
+        'scenario', help='Show the gains of selling over a grid of prices')
+    parser_scenario.add_argument('symbols', nargs='*',
+                                 help='Stock symbols, all if none are given')
+    parser_scenario.add_argument('--percent', '-p', type=float, nargs='+',
+                                 default=DEFAULT_SCENARIO_PERCENT,
+                                 help='Percent swings up and down from the '
+                                      'current price')
+    parser_scenario.add_argument('--level', '-l', action='append',
+                                 help='Prices to sell a symbol at as '
+                                      'SYMBOL=PRICE,PRICE,...')
+    parser_scenario.add_argument('--lots', action='store_true',
+                                 default=False,
+                                 help='Show the gain of selling each lot')
+    parser_scenario.add_argument('--json',
+                                 help='Write all scenarios to a JSON file')
+    parser_scenario.set_defaults(func=scenario)
+
+    parser_bands = subparsers.add_parser(
+        'bands', help='Show the price bands of every held symbol or lot')
+    parser_bands.add_argument('symbols', nargs='*',
+                              help='Stock symbols, all if none are given')
+    parser_bands.set_defaults(func=show_bands)
+
     parser_query_one = subparsers.add_parser(
         'query_one', help='Query one symbol')
     parser_query_one.add_argument('symbol',
@@ -795,6 +1415,22 @@ def parse_args():
         'query_all', help='Query all symbols')
     parser_query_all.set_defaults(func=query_all)
 
+    parser_watch = subparsers.add_parser(
+        'watch', help='Continuously query all symbols')
+    parser_watch.add_argument('-i', '--interval', type=float,
+                              default=DEFAULT_WATCH_INTERVAL,
+                              help='Seconds between quote updates')
+    parser_watch.set_defaults(func=watch)
+
+    parser_history = subparsers.add_parser(
+        'history', help='Show the stored quote history for a symbol')
+    parser_history.add_argument('symbol', help='Stock symbol')
+    parser_history.add_argument('--start',
+                                help='Start date/time (ISO format)')
+    parser_history.add_argument('--end',
+                                help='End date/time (ISO format)')
+    parser_history.set_defaults(func=history)
+
     parser_add = subparsers.add_parser(
         'add', help='Add a new position held')
     parser_add.add_argument('symbol', help='Stock symbol')
@@ -841,30 +1477,136 @@ def parse_args():
                                 help='Position index')
     parser_until.set_defaults(func=until)
 
+    parser_compact = subparsers.add_parser(
+        'compact', help='Fold the share change journal into the shares file')
+    parser_compact.set_defaults(func=compact)
+
+    parser_batch = subparsers.add_parser(
+        'batch', help='Apply many share changes at once')
+    parser_batch.add_argument('file', nargs='?', default='-',
+                              help='CSV or JSON lines file of changes, '
+                                   '"-" for stdin')
+    parser_batch.add_argument('-f', '--format', choices=['csv', 'jsonl'],
+                              help='Input format (default: detect)')
+    parser_batch.add_argument('-k', '--keep-going', action='store_true',
+                              default=False,
+                              help='Save the changes that applied even if '
+                                   'others failed')
+    parser_batch.set_defaults(func=batch)
+
     return parser.parse_args()
 
 
+def replay_journal(portfolio, records):
+    """Apply journaled changes to the portfolio.
+
+       A change that no longer applies is reported and skipped, so one bad
+       record does not make the shares unreadable."""
+    for record in records:
+        try:
+            change = parse_change(record)
+            change['time'] = record.get('time')
+            apply_change(portfolio, change)
+        except ValueError as e:
+            print("skipping journal record {}: {}".format(record['seq'], e),
+                  file=sys.stderr)
+        portfolio.data[SNAPSHOT_SEQ_KEY] = record['seq']
+
+
 def get_share_data(filename):
-    """Get the share information for the user."""
-    data = []
-    with open(filename) as fp:
-        data = json.load(fp)
+    """Get the share information for the user.
+
+       Changes journaled since the last snapshot are applied."""
+    filename = os.path.expanduser(filename)
+    data = load_json(filename)
+
+    if isinstance(data, dict):
+        records = read_journal(filename,
+                               after=data.get(SNAPSHOT_SEQ_KEY, 0))
+        if records:
+            portfolio = Portfolio.from_dict(data)
+            replay_journal(portfolio, records)
+            data = portfolio.to_dict()
 
     return data
 
 
+def get_portfolio(filename):
+    """Get the share information for the user as a Portfolio.
+
+       Changes journaled since the last snapshot are applied."""
+    filename = os.path.expanduser(filename)
+    portfolio = Portfolio.from_dict(load_json(filename))
+
+    replay_journal(portfolio, read_journal(
+        filename, after=portfolio.data.get(SNAPSHOT_SEQ_KEY, 0)))
+
+    return portfolio
+
+
 def set_share_data(filename, share_data):
     """Write the share information for the user."""
+    filename = os.path.expanduser(filename)
+    tmp_filename = '{}.tmp'.format(filename)
 
-    with open(filename, 'w') as fp:
+    with open(tmp_filename, 'w') as fp:
         json.dump(share_data, fp, indent=4)
+    os.replace(tmp_filename, filename)
+
+
+def save_share_data(filename, portfolio, changes, journal=False):
+    """Save changes to the user's portfolio.
+
+       In journal mode only the changes are appended to the journal,
+       otherwise a new snapshot is written and the journal removed."""
+    filename = os.path.expanduser(filename)
+
+    if journal:
+        portfolio.data[SNAPSHOT_SEQ_KEY] = append_journal(
+            filename, changes, portfolio.data.get(SNAPSHOT_SEQ_KEY, 0))
+    else:
+        set_share_data(filename, portfolio.to_dict())
+        clear_journal(filename)
+
+
+def run_cprofile(args):
+    """Run the command under cProfile."""
+    import cProfile
+    import pstats
+
+    cprofile = cProfile.Profile()
+    try:
+        cprofile.runcall(args.func, args)
+    finally:
+        if args.cprofile == '-':
+            stats = pstats.Stats(cprofile, stream=sys.stderr)
+            stats.sort_stats('cumulative').print_stats(25)
+        else:
+            cprofile.dump_stats(args.cprofile)
 
 
 def main():
     """The main method."""
     args = parse_args()
 
-    args.func(args)
+    if args.profile or args.profile_output:
+        profiler = profiling.enable()
+        profiler.instrument(sys.modules[__name__],
+                            ['color_value', 'get_market_data'])
+        profiler.instrument(RowFormat, ['format'])
+
+    try:
+        if args.cprofile:
+            run_cprofile(args)
+        else:
+            args.func(args)
+    finally:
+        profiler = profiling.disable()
+        if profiler is not None:
+            if args.profile:
+                profiler.report()
+            if args.profile_output:
+                profiler.save(args.profile_output)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,149 @@
+"""Per phase timing of the pricer commands.
+
+Code marks its phases with ``with profiling.phase('name'):`` and these do
+nothing until a Profiler is enabled, so the marks can stay in place.  An
+enabled profiler records the calls, wall time and CPU time of every phase
+and can count the calls of chosen functions by wrapping them.
+
+Phases run on worker threads, such as the concurrent quote requests, are
+timed per thread so their wall times can add up to more than the run.
+"""
+import contextlib
+import functools
+import json
+import sys
+import threading
+import time
+
+# the enabled profiler, if any
+profiler = None
+
+NULL_PHASE = contextlib.nullcontext()
+
+
+class Profiler:
+    """Phase times and call counts for a run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> [calls, wall time, cpu time]
+        self.phases = {}
+        # name -> calls
+        self.counts = {}
+        # (object, attribute, original) for every wrapped function
+        self.wrapped = []
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        self.wall = None
+        self.cpu = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall,
+                     time.thread_time() - cpu)
+
+    def add(self, name, wall, cpu):
+        """Add a call of a phase."""
+        with self.lock:
+            stats = self.phases.get(name)
+            if stats is None:
+                stats = self.phases[name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+
+    def count(self, name, calls=1):
+        """Count calls of name."""
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + calls
+
+    def instrument(self, obj, names):
+        """Count the calls of functions of a module or class by wrapping
+           them until stop() is called."""
+        prefix = ''
+        if isinstance(obj, type):
+            prefix = '{}.'.format(obj.__name__)
+
+        for name in names:
+            func = getattr(obj, name)
+            self.wrapped.append((obj, name, func))
+            setattr(obj, name, self.counter(func, prefix + name))
+
+    def counter(self, func, name):
+        self.counts.setdefault(name, 0)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            self.count(name)
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    def stop(self):
+        """Stop the run's clocks and put the wrapped functions back."""
+        self.wall = time.perf_counter() - self.start_wall
+        self.cpu = time.process_time() - self.start_cpu
+        for obj, name, func in reversed(self.wrapped):
+            setattr(obj, name, func)
+        self.wrapped = []
+
+    def to_dict(self):
+        return {
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'phases': {
+                name: {'calls': calls, 'wall': wall, 'cpu': cpu}
+                for name, (calls, wall, cpu) in self.phases.items()
+            },
+            'counts': dict(self.counts),
+        }
+
+    def report(self, fp=sys.stderr):
+        """Write a summary table."""
+        fp.write("{:<12s} {:>8s} {:>12s} {:>12s}\n".format(
+            'phase', 'calls', 'wall ms', 'cpu ms'))
+        for name, (calls, wall, cpu) in self.phases.items():
+            fp.write("{:<12s} {:8d} {:12.3f} {:12.3f}\n".format(
+                name, calls, wall * 1000, cpu * 1000))
+        if self.wall is not None:
+            fp.write("{:<12s} {:>8s} {:12.3f} {:12.3f}\n".format(
+                'total', '', self.wall * 1000, self.cpu * 1000))
+        for name, calls in self.counts.items():
+            fp.write("{:<24s} {:8d} calls\n".format(name, calls))
+
+    def save(self, filename):
+        """Write the results to a JSON file."""
+        with open(filename, 'w') as fp:
+            json.dump(self.to_dict(), fp, indent=4)
+
+
+def enable():
+    """Start profiling, returning the new profiler."""
+    global profiler
+
+    profiler = Profiler()
+    return profiler
+
+
+def disable():
+    """Stop profiling, returning the stopped profiler if there was one."""
+    global profiler
+
+    stopped, profiler = profiler, None
+    if stopped is not None:
+        stopped.stop()
+
+    return stopped
+
+
+def phase(name):
+    """Time a phase of the run if profiling is enabled."""
+    if profiler is None:
+        return NULL_PHASE
+
+    return profiler.phase(name)
@@ -0,0 +1,349 @@
+"""Quote providers.
+
+Every provider returns Yahoo shaped quote records (symbol, marketState,
+regularMarketPrice, ...) keyed by symbol, so the report code does not care
+where a quote came from.
+"""
+import random
+import time
+
+import http_session
+from profiling import phase
+
+YAHOO_ENDPOINT = (
+    "https://query1.finance.yahoo.com/v7/finance/quote"
+    "?lang=en-US&region=US&corsDomain=finance.yahoo.com"
+)
+FINNHUB_QUOTE_ENDPOINT = "https://finnhub.io/api/v1/quote"
+
+# Large symbol lists are split into chunks that are fetched concurrently so
+# the request URL stays bounded.
+QUOTE_CHUNK_SIZE = 100
+QUOTE_MAX_WORKERS = 8
+
+# Seconds to wait for the primary provider before also asking the fallback
+DEFAULT_HEDGE_AFTER = 1.0
+
+QUOTE_STRING_FIELDS = [
+    'symbol',
+    'marketState',
+    'regularMarketPrice',
+]
+QUOTE_FLOAT_FIELDS = [
+    'regularMarketChange',
+    'regularMarketChangePercent',
+    'preMarketPrice',
+    'preMarketChange',
+    'preMarketChangePercent',
+    'postMarketPrice',
+    'postMarketChange',
+    'postMarketChangePercent',
+]
+QUOTE_TIME_FIELDS = [
+    'regularMarketTime',
+    'preMarketTime',
+    'postMarketTime',
+]
+QUOTE_FIELDS = QUOTE_STRING_FIELDS + QUOTE_FLOAT_FIELDS + QUOTE_TIME_FIELDS
+
+
+def map_concurrently(func, items, max_workers):
+    """Call func for every item on a thread pool, returning the results in
+       order."""
+    if len(items) <= 1:
+        return [func(x) for x in items]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as e:
+        return list(e.map(func, items))
+
+
+class Provider:
+    """Base class for quote providers."""
+
+    name = None
+
+    def get_quotes(self, symbols):
+        """Get the quote records for the symbols keyed by symbol.
+
+           Symbols without a good quote are left out."""
+        raise NotImplementedError
+
+
+class YahooProvider(Provider):
+    """Quotes from Yahoo's v7 quote endpoint."""
+
+    name = 'yahoo'
+
+    def __init__(self, endpoint=None, fields=QUOTE_FIELDS,
+                 chunk_size=QUOTE_CHUNK_SIZE, max_workers=QUOTE_MAX_WORKERS):
+        self.endpoint = endpoint
+        self.fields = fields
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+
+    def fetch_chunk(self, symbols):
+        """Fetch the quote records for a single chunk of symbols."""
+        import requests
+
+        try:
+            with phase('http'):
+                result = http_session.get(
+                    self.endpoint or YAHOO_ENDPOINT,
+                    params={
+                        'symbols': ','.join(symbols),
+                        'fields': ','.join(self.fields),
+                    },
+                    headers={
+                        'User-Agent': '',
+                    },
+                )
+        except requests.RequestException as e:
+            print("request error: {}".format(e))
+            return []
+
+        if result.status_code != 200:
+            print("status_code: {}".format(result.status_code))
+            return []
+
+        with phase('decode'):
+            data = result.json()
+
+        response = data.get('quoteResponse')
+        if response is not None:
+            data = response
+
+        data_result = data.get('result')
+        data_error = data.get('error')
+        if data_error is not None:
+            print("data_error: {}".format(data_error))
+        if data_result is None:
+            return []
+
+        return data_result
+
+    def get_quotes(self, symbols):
+        """Get the quotes, fetching chunks of at most chunk_size symbols on
+           a thread pool of at most max_workers threads."""
+        chunks = [symbols[i:i + self.chunk_size]
+                  for i in range(0, len(symbols), self.chunk_size)]
+
+        quotes = {}
+        for result in map_concurrently(self.fetch_chunk, chunks,
+                                       self.max_workers):
+            for item in result:
+                quotes[item.get('symbol')] = item
+
+        return quotes
+
+
+class FinnhubProvider(Provider):
+    """Quotes from Finnhub's REST quote endpoint, one request per symbol."""
+
+    name = 'finnhub'
+
+    def __init__(self, api_key, max_workers=QUOTE_MAX_WORKERS):
+        self.api_key = api_key
+        self.max_workers = max_workers
+
+    def get_quote(self, symbol):
+        """Get Finnhub's quote data for a symbol."""
+        with phase('http'):
+            result = http_session.get(
+                FINNHUB_QUOTE_ENDPOINT,
+                params={'symbol': symbol},
+                headers={'X-Finnhub-Token': self.api_key},
+            )
+        result.raise_for_status()
+
+        with phase('decode'):
+            return result.json()
+
+    def get_record(self, symbol):
+        """Get a Yahoo shaped quote record for a symbol, if there is one."""
+        import requests
+
+        try:
+            data = self.get_quote(symbol)
+        except requests.RequestException as e:
+            print("request error: {}".format(e))
+            return None
+
+        # Finnhub answers unknown symbols with all zero values
+        if not data.get('c'):
+            return None
+
+        return {
+            'symbol': symbol,
+            'marketState': 'REGULAR',
+            'regularMarketPrice': data['c'],
+            'regularMarketChange': data.get('d') or 0.0,
+            'regularMarketChangePercent': data.get('dp') or 0.0,
+            'regularMarketTime': data.get('t'),
+            'regularMarketOpen': data.get('o'),
+            'regularMarketDayHigh': data.get('h'),
+            'regularMarketDayLow': data.get('l'),
+            'regularMarketPreviousClose': data.get('pc'),
+        }
+
+    def get_quotes(self, symbols):
+        quotes = {}
+        for record in map_concurrently(self.get_record, symbols,
+                                       self.max_workers):
+            if record is not None:
+                quotes[record['symbol']] = record
+
+        return quotes
+
+
+class FakeProvider(Provider):
+    """Made up but stable quotes for testing without the network.
+
+       Each symbol gets its own reproducible price walk.  latency seconds
+       are spent per call and a fraction of the symbols, given by
+       failure_rate, get no quote."""
+
+    name = 'fake'
+
+    def __init__(self, latency=0.0, failure_rate=0.0,
+                 market_state='REGULAR'):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.market_state = market_state
+
+    def get_quotes(self, symbols):
+        if self.latency:
+            time.sleep(self.latency)
+
+        now = int(time.time())
+        quotes = {}
+        for symbol in symbols:
+            rand = random.Random(symbol)
+            if rand.random() < self.failure_rate:
+                continue
+            previous = round(rand.uniform(5.0, 500.0), 2)
+            # move at most 5% a day, changing once a minute
+            step = random.Random('{}{}'.format(symbol, now // 60))
+            price = round(previous * (1 + step.uniform(-0.05, 0.05)), 2)
+            change = price - previous
+            quotes[symbol] = {
+                'symbol': symbol,
+                'marketState': self.market_state,
+                'regularMarketPrice': price,
+                'regularMarketChange': change,
+                'regularMarketChangePercent': change / previous * 100,
+                'regularMarketTime': now // 60 * 60,
+            }
+
+        return quotes
+
+
+class BoardProvider(Provider):
+    """The last trade prices fh-ws.py publishes on its price board.
+
+       Trades carry no previous close, so the day's change is left at
+       zero.  Symbols without a trade on the board get no quote."""
+
+    name = 'board'
+
+    def __init__(self, filename=None):
+        from price_board import DEFAULT_BOARD_FILE
+
+        self.filename = filename or DEFAULT_BOARD_FILE
+
+    def get_quotes(self, symbols):
+        from price_board import PriceBoard
+
+        quotes = {}
+        try:
+            board = PriceBoard(self.filename)
+        except (OSError, ValueError) as e:
+            print("price board error: {}".format(e))
+            return quotes
+
+        with board:
+            for symbol in symbols:
+                value = board.get(symbol)
+                if value is None:
+                    continue
+                price, trade_time, _, _ = value
+                quotes[symbol] = {
+                    'symbol': symbol,
+                    'marketState': 'REGULAR',
+                    'regularMarketPrice': price,
+                    'regularMarketChange': 0.0,
+                    'regularMarketChangePercent': 0.0,
+                    'regularMarketTime': trade_time // 1000,
+                }
+
+        return quotes
+
+
+PROVIDERS = ['yahoo', 'finnhub', 'fake', 'board']
+
+
+def get_provider(name, chunk_size=QUOTE_CHUNK_SIZE,
+                 max_workers=QUOTE_MAX_WORKERS):
+    """Create a provider by name."""
+    if name == 'yahoo':
+        return YahooProvider(chunk_size=chunk_size, max_workers=max_workers)
+    if name == 'finnhub':
+        from config import API_KEY
+
+        return FinnhubProvider(API_KEY, max_workers=max_workers)
+    if name == 'fake':
+        return FakeProvider()
+    if name == 'board':
+        return BoardProvider()
+
+    raise ValueError("unknown provider '{}'".format(name))
+
+
+def fetch_hedged(symbols, primary, secondary=None,
+                 hedge_after=DEFAULT_HEDGE_AFTER):
+    """Get quotes from the primary provider, hedging with the secondary.
+
+       If the primary has not answered within hedge_after seconds, fails or
+       leaves symbols out, the missing symbols are also requested from the
+       secondary provider.  The first good quote for each symbol wins."""
+    if secondary is None:
+        return primary.get_quotes(symbols)
+
+    from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                    wait)
+
+    quotes = {}
+    executor = ThreadPoolExecutor(max_workers=2)
+    pending = {executor.submit(primary.get_quotes, symbols): primary}
+    hedged = False
+    deadline = time.monotonic() + hedge_after
+    try:
+        while pending:
+            timeout = None
+            if not hedged:
+                timeout = max(0.0, deadline - time.monotonic())
+            done, _ = wait(pending, timeout=timeout,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print("{} error: {}".format(provider.name, e))
+                    result = {}
+                for symbol, quote in result.items():
+                    quotes.setdefault(symbol, quote)
+
+            missing = [x for x in symbols if x not in quotes]
+            if not missing:
+                break
+            if not hedged and (not pending or time.monotonic() >= deadline):
+                future = executor.submit(secondary.get_quotes, missing)
+                pending[future] = secondary
+                hedged = True
+    finally:
+        # a slow provider must not hold up the answer
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return quotes
@@ -0,0 +1,124 @@
+"""On-disk quote cache with market state dependent expiry."""
+import datetime
+import json
+import os
+import time
+from zoneinfo import ZoneInfo
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'),
+                                  'pricer_quote_cache.json')
+
+# Seconds a quote stays fresh in each market state.  Quotes for a closed
+# market stay fresh until the next session starts.
+REGULAR_TTL = 15
+EXTENDED_TTL = 60
+
+MARKET_TIMEZONE = ZoneInfo('America/New_York')
+# Pre-market trading starts at 4:00 US/Eastern
+SESSION_START = datetime.time(4, 0)
+
+
+def get_next_session(now):
+    """Get the start time of the next trading session after now."""
+    local = datetime.datetime.fromtimestamp(now, MARKET_TIMEZONE)
+    day = local.date()
+    if local.time() >= SESSION_START:
+        day += datetime.timedelta(days=1)
+    while day.weekday() >= 5:  # skip weekends
+        day += datetime.timedelta(days=1)
+
+    session = datetime.datetime.combine(day, SESSION_START,
+                                        tzinfo=MARKET_TIMEZONE)
+    return session.timestamp()
+
+
+def get_expiry(market_state, now):
+    """Get the time a quote fetched at now in market_state expires."""
+    if market_state == 'REGULAR':
+        return now + REGULAR_TTL
+    if market_state in ['PRE', 'POST']:
+        return now + EXTENDED_TTL
+
+    # CLOSED, PREPRE, POSTPOST
+    return get_next_session(now)
+
+
+class QuoteCache:
+    """Quote records keyed by provider and symbol along with their expiry
+       time.
+
+       Quotes are only returned for the provider they were cached for, so
+       made up or board quotes never stand in for another provider's."""
+
+    def __init__(self, filename=DEFAULT_CACHE_FILE, provider='yahoo'):
+        self.filename = filename
+        self.provider = provider
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """Load the cache file if there is one."""
+        try:
+            with open(self.filename) as fp:
+                entries = json.load(fp)
+        except (IOError, ValueError):
+            entries = {}
+
+        # entries keyed by symbol alone do not say where they came from
+        self.entries = {k: v for k, v in entries.items() if ':' in k}
+
+    def get_key(self, symbol):
+        return '{}:{}'.format(self.provider, symbol)
+
+    def save(self):
+        """Atomically write the cache file if anything changed."""
+        if not self.dirty:
+            return
+
+        tmp_filename = '{}.tmp'.format(self.filename)
+        with open(tmp_filename, 'w') as fp:
+            json.dump(self.entries, fp)
+        os.replace(tmp_filename, self.filename)
+        self.dirty = False
+
+    def get(self, symbol, now=None, offline=False):
+        """Get the cached quote for a symbol unless it has expired.
+
+           In offline mode expired quotes are returned as well."""
+        entry = self.entries.get(self.get_key(symbol))
+        if entry is None:
+            return None
+
+        if now is None:
+            now = time.time()
+        if offline or entry['expires'] > now:
+            return entry['quote']
+
+        return None
+
+    def put(self, symbol, quote, now=None):
+        """Cache a quote record."""
+        if now is None:
+            now = time.time()
+
+        self.entries[self.get_key(symbol)] = {
+            'fetched': now,
+            'expires': get_expiry(quote.get('marketState'), now),
+            'quote': quote,
+        }
+        self.dirty = True
+
+    def split(self, symbols, offline=False):
+        """Split symbols into cached quotes and the symbols to fetch."""
+        now = time.time()
+        quotes = {}
+        missing = []
+        for symbol in symbols:
+            quote = self.get(symbol, now=now, offline=offline)
+            if quote is None:
+                missing.append(symbol)
+            else:
+                quotes[symbol] = quote
+
+        return quotes, missing
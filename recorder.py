@@ -0,0 +1,109 @@
+"""Buffered append-only recorder for quote history.
+
+Records are written as one JSON document per line to a file per day.  Each
+data file has a small index file next to it holding the first and last
+record timestamps and the record count.
+"""
+import datetime
+import json
+import os
+import time
+
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser('~'), 'pricer_data')
+DEFAULT_PREFIX = 'pricer_data'
+DEFAULT_FLUSH_INTERVAL = 5.0  # seconds
+DEFAULT_FLUSH_SIZE = 1000  # records
+
+
+class TickRecorder:
+    """Buffer records in memory and append them to daily files in batches."""
+
+    def __init__(self, directory=DEFAULT_DATA_DIR, prefix=DEFAULT_PREFIX,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 flush_size=DEFAULT_FLUSH_SIZE, fsync=True):
+        self.directory = directory
+        self.prefix = prefix
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.fsync = fsync
+
+        self.buffer = []
+        self.day = None
+        self.fp = None
+        self.index = None
+        self.last_flush = time.monotonic()
+
+    def get_filename(self, day):
+        """Get the data file name for the given day."""
+        return os.path.join(self.directory,
+                            '{}-{}.jsonl'.format(self.prefix, day))
+
+    def get_index_filename(self, day):
+        """Get the index file name for the given day."""
+        return '{}.idx'.format(self.get_filename(day))
+
+    def append(self, data, timestamp=None):
+        """Buffer a record, flushing when the buffer is big or old enough."""
+        if timestamp is None:
+            timestamp = time.time()
+
+        day = datetime.date.fromtimestamp(timestamp).isoformat()
+        if day != self.day:
+            self.rotate(day)
+
+        self.buffer.append(json.dumps(data, separators=(',', ':')))
+        if self.index['first'] is None:
+            self.index['first'] = timestamp
+        self.index['last'] = timestamp
+        self.index['count'] += 1
+
+        if (
+            len(self.buffer) >= self.flush_size or
+            time.monotonic() - self.last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def rotate(self, day):
+        """Flush the current day's data and switch to the given day."""
+        self.flush()
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+        self.day = day
+        self.index = {'first': None, 'last': None, 'count': 0}
+        try:
+            with open(self.get_index_filename(day)) as fp:
+                self.index.update(json.load(fp))
+        except (IOError, ValueError):
+            pass
+
+    def flush(self):
+        """Write out the buffered records and the index."""
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+
+        if self.fp is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.fp = open(self.get_filename(self.day), 'a')
+
+        self.fp.write('\n'.join(self.buffer))
+        self.fp.write('\n')
+        self.fp.flush()
+        if self.fsync:
+            os.fsync(self.fp.fileno())
+        self.buffer = []
+
+        index_filename = self.get_index_filename(self.day)
+        tmp_filename = '{}.tmp'.format(index_filename)
+        with open(tmp_filename, 'w') as fp:
+            json.dump(self.index, fp)
+        os.replace(tmp_filename, index_filename)
+
+    def close(self):
+        """Flush any buffered records and close the data file."""
+        self.flush()
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
@@ -0,0 +1,98 @@
+"""Precompiled table row formatting.
+
+A row layout is described once as a list of columns.  The format string for
+each color/bold combination is built the first time it is needed, so
+rendering a row is a single str.format call.
+"""
+
+# Colors
+RED = '\033[31m'
+GREEN = '\033[32m'
+BOLD = '\033[1m'
+ENDC = '\033[0m'
+
+COLORS = {
+    'red': RED,
+    'green': GREEN,
+}
+
+
+class Column:
+    """Layout of a single table column.
+
+       Numbers are formatted with the given width and precision and right
+       aligned to field_width.  Percent values are shown as "(value%)".
+       The row color applies to the column unless color is False and the
+       row bold setting applies unless bold is True or False."""
+
+    __slots__ = ('width', 'precision', 'field_width', 'percent', 'string',
+                 'color', 'bold', 'spec', 'prepare')
+
+    def __init__(self, width=10, precision=4, field_width=10, percent=False,
+                 string=False, color=True, bold=None):
+        self.width = width
+        self.precision = precision
+        self.field_width = field_width
+        self.percent = percent
+        self.string = string
+        self.color = color
+        self.bold = bold
+
+        self.prepare = None
+        if string:
+            self.spec = '{{:>{}s}}'.format(field_width)
+        elif percent:
+            self.spec = '{{:>{}s}}'.format(field_width)
+            self.prepare = '({{:.{}f}}%)'.format(precision).format
+        else:
+            self.spec = '{{:>{}.{}f}}'.format(max(width, field_width),
+                                              precision)
+
+    def compile(self, color='', bold=False):
+        """Get the format string for this column."""
+        if not self.color:
+            color = ''
+        if self.bold is not None:
+            bold = self.bold
+
+        cs = COLORS.get(color, '')
+        if bold:
+            cs = '{}{}'.format(cs, BOLD)
+
+        # add color codes around the padded value so that they do not count
+        # towards the field width
+        if cs:
+            return '{}{}{}'.format(cs, self.spec, ENDC)
+        return self.spec
+
+
+class RowFormat:
+    """Format rows of values for a fixed list of columns."""
+
+    def __init__(self, columns, separator=' '):
+        self.columns = columns
+        self.separator = separator
+        self.prepared = [(i, column.prepare)
+                         for i, column in enumerate(columns)
+                         if column.prepare is not None]
+        self.templates = {}
+
+    def get_template(self, color='', bold=False):
+        """Get the row format string for a color and bold setting."""
+        key = (color, bold)
+        template = self.templates.get(key)
+        if template is None:
+            template = self.separator.join(
+                column.compile(color, bold) for column in self.columns)
+            self.templates[key] = template
+
+        return template
+
+    def format(self, values, color='', bold=False):
+        """Format a row of values."""
+        if self.prepared:
+            values = list(values)
+            for i, prepare in self.prepared:
+                values[i] = prepare(values[i])
+
+        return self.get_template(color, bold).format(*values)
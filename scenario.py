@@ -0,0 +1,122 @@
+"""Vectorized what-if sell scenarios.
+
+Every lot of a portfolio Valuation is sold, on paper, at every point of a
+per-symbol price grid in a few numpy passes.  Grids are a matrix with a row
+per valuation symbol; symbols with fewer grid points than others are padded
+with NaN.
+"""
+import numpy as np
+
+
+def get_percent_steps(swings):
+    """Get the sorted percent steps for swings of +/- each given percent,
+       including no change."""
+    steps = {0.0}
+    for swing in swings:
+        steps.add(float(swing))
+        steps.add(-float(swing))
+
+    return sorted(steps)
+
+
+def build_grid(count, levels, prices=None, steps=()):
+    """Build the price grid for count valuation symbols.
+
+       levels maps a symbol index to its list of absolute prices.  Every
+       other symbol with a price in prices gets the percent steps around
+       that price.  Symbols with neither have an all NaN row."""
+    rows = []
+    for sid in range(count):
+        row = levels.get(sid)
+        if row is None:
+            price = np.nan if prices is None else prices[sid]
+            row = [price * (1 + step / 100) for step in steps]
+        rows.append(row)
+
+    width = max([len(x) for x in rows], default=0)
+    grid = np.full((count, width), np.nan)
+    for sid, row in enumerate(rows):
+        grid[sid, :len(row)] = row
+
+    return grid
+
+
+class Scenarios:
+    """Realized gains, remaining shares and average costs of selling at
+       every grid price.
+
+       Per lot (lots x grid points): lot_gain is the gain of selling just
+       that lot, leaving lot_remaining_shares at lot_remaining_avg.
+
+       Per symbol (symbols x grid points): all_gain is the gain of selling
+       every lot and winner_gain that of selling only the lots with a gain,
+       leaving winner_remaining_shares at winner_remaining_avg.
+
+       Per grid point the total_* values add up the symbols that have a
+       price at that point."""
+
+    def __init__(self, valuation, grid):
+        self.valuation = valuation
+        self.grid = grid
+        sid = valuation.symbol_id
+        cost = valuation.cost[:, None]
+        shares = valuation.shares[:, None]
+        symbol_shares = valuation.symbol_shares[:, None]
+        symbol_basis = valuation.symbol_basis[:, None]
+
+        lot_price = grid[sid]
+        self.lot_gain = shares * (lot_price - cost)
+        self.lot_remaining_shares = valuation.symbol_shares[sid] - \
+            valuation.shares
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.lot_remaining_avg = (
+                (valuation.symbol_basis[sid] -
+                 valuation.shares * valuation.cost) /
+                self.lot_remaining_shares)
+
+        self.all_gain = symbol_shares * grid - symbol_basis
+
+        winners = self.lot_gain > 0
+        sold_shares = np.zeros(grid.shape)
+        sold_basis = np.zeros(grid.shape)
+        self.winner_gain = np.zeros(grid.shape)
+        np.add.at(sold_shares, sid, shares * winners)
+        np.add.at(sold_basis, sid, shares * cost * winners)
+        np.add.at(self.winner_gain, sid, np.where(winners, self.lot_gain, 0))
+        self.winner_gain[np.isnan(grid)] = np.nan
+        self.winner_remaining_shares = symbol_shares - sold_shares
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.winner_remaining_avg = (
+                (symbol_basis - sold_basis) / self.winner_remaining_shares)
+
+        self.total_all_gain = np.nansum(self.all_gain, axis=0)
+        self.total_winner_gain = np.nansum(self.winner_gain, axis=0)
+        self.total_remaining_shares = np.nansum(
+            np.where(np.isnan(grid), np.nan, self.winner_remaining_shares),
+            axis=0)
+
+    def to_dict(self):
+        """Get the scenarios as JSON friendly lists, NaN as None."""
+        def values(array):
+            return np.where(np.isnan(array), None, array).tolist()
+
+        valuation = self.valuation
+        return {
+            'symbols': valuation.symbols,
+            'grid': values(self.grid),
+            'lots': {
+                'symbol': [valuation.symbols[x] for x in valuation.symbol_id],
+                'cost': valuation.cost.tolist(),
+                'shares': valuation.shares.tolist(),
+                'gain': values(self.lot_gain),
+                'remaining_shares': self.lot_remaining_shares.tolist(),
+                'remaining_avg': values(self.lot_remaining_avg),
+            },
+            'all_gain': values(self.all_gain),
+            'winner_gain': values(self.winner_gain),
+            'winner_remaining_shares': values(self.winner_remaining_shares),
+            'winner_remaining_avg': values(self.winner_remaining_avg),
+            'total_all_gain': self.total_all_gain.tolist(),
+            'total_winner_gain': self.total_winner_gain.tolist(),
+            'total_remaining_shares': self.total_remaining_shares.tolist(),
+        }
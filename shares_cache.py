@@ -0,0 +1,51 @@
+"""Binary cache of parsed JSON data files.
+
+Parsing a large shares file dominates the start up of short lived commands.
+The parsed data is kept in a marshal file keyed by the data file's path,
+modification time and size, so it is only parsed again after it changes.
+"""
+import hashlib
+import json
+import marshal
+import os
+import sys
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pricer')
+
+
+def get_cache_filename(filename, cache_dir=DEFAULT_CACHE_DIR):
+    """Get the cache file name for a data file."""
+    key = hashlib.sha1(filename.encode()).hexdigest()
+    return os.path.join(cache_dir, '{}.marshal'.format(key))
+
+
+def load_json(filename, cache_dir=DEFAULT_CACHE_DIR):
+    """Load a JSON file, using the cached parsed data if it is current."""
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    stamp = (filename, stat.st_mtime_ns, stat.st_size, marshal.version,
+             tuple(sys.version_info[:2]))
+    cache_filename = get_cache_filename(filename, cache_dir)
+
+    try:
+        with open(cache_filename, 'rb') as fp:
+            cached_stamp, data = marshal.loads(fp.read())
+        if cached_stamp == stamp:
+            return data
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(filename) as fp:
+        data = json.load(fp)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_filename = '{}.{}.tmp'.format(cache_filename, os.getpid())
+        with open(tmp_filename, 'wb') as fp:
+            fp.write(marshal.dumps((stamp, data)))
+        os.replace(tmp_filename, cache_filename)
+    except (OSError, ValueError):
+        # the data is still good without a cache
+        pass
+
+    return data
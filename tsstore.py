@@ -0,0 +1,216 @@
+"""Columnar time series store for recorded quotes.
+
+Each symbol has a directory holding one file per column.  Every column file
+is a packed array of native machine values, so the files can be memory
+mapped and read without parsing:
+
+    time     int64    record time (epoch seconds), ascending
+    price    float64
+    change   float64
+    percent  float64
+    state    uint8    index into MARKET_STATES
+    type     uint8    index into RECORD_TYPES
+"""
+import bisect
+import mmap
+import os
+import struct
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser('~'), 'pricer_store')
+
+MARKET_STATES = ['PREPRE', 'PRE', 'REGULAR', 'POST', 'POSTPOST', 'CLOSED']
+RECORD_TYPES = ['regular', 'pre', 'post']
+UNKNOWN = 255
+
+# column name -> array typecode
+COLUMNS = {
+    'time': 'q',
+    'price': 'd',
+    'change': 'd',
+    'percent': 'd',
+    'state': 'B',
+    'type': 'B',
+}
+
+
+def encode(values, value):
+    """Get the uint8 code for a string value."""
+    try:
+        return values.index(value)
+    except ValueError:
+        return UNKNOWN
+
+
+def decode(values, code):
+    """Get the string value for a uint8 code."""
+    if code < len(values):
+        return values[code]
+    return None
+
+
+class ColumnStore:
+    """Append quote records per symbol and query them by time range."""
+
+    def __init__(self, directory=DEFAULT_STORE_DIR):
+        self.directory = directory
+        # symbol -> column name -> list of buffered values
+        self.pending = {}
+        # symbol -> last stored record time
+        self.last_time = {}
+
+    def get_column_filename(self, symbol, column):
+        """Get the file name of one of a symbol's columns."""
+        return os.path.join(self.directory, symbol, column)
+
+    def repair(self, symbol):
+        """Cut a symbol's columns back to the records all of them have, so
+           appends after a flush that stopped part way stay aligned."""
+        sizes = {}
+        for column, typecode in COLUMNS.items():
+            try:
+                size = os.path.getsize(self.get_column_filename(symbol,
+                                                                column))
+            except OSError:
+                size = 0
+            sizes[column] = size // struct.calcsize(typecode)
+
+        length = min(sizes.values())
+        for column, typecode in COLUMNS.items():
+            if sizes[column] > length:
+                os.truncate(self.get_column_filename(symbol, column),
+                            length * struct.calcsize(typecode))
+
+    def get_last_time(self, symbol):
+        """Get the most recent record time stored for a symbol."""
+        if symbol not in self.last_time:
+            self.repair(symbol)
+            last_time = None
+            try:
+                with open(self.get_column_filename(symbol, 'time'),
+                          'rb') as fp:
+                    fp.seek(0, os.SEEK_END)
+                    size = fp.tell()
+                    if size >= 8:
+                        fp.seek(size - 8)
+                        last_time = struct.unpack('q', fp.read(8))[0]
+            except IOError:
+                pass
+            self.last_time[symbol] = last_time
+
+        return self.last_time[symbol]
+
+    def append(self, symbol, record_time, price, change, percent,
+               market_state, record_type):
+        """Buffer a record, ignoring records older than the last one."""
+        record_time = int(record_time)
+        last_time = self.get_last_time(symbol)
+        if last_time is not None and record_time <= last_time:
+            return False
+
+        columns = self.pending.setdefault(
+            symbol, {column: [] for column in COLUMNS})
+        columns['time'].append(record_time)
+        columns['price'].append(price)
+        columns['change'].append(change)
+        columns['percent'].append(percent)
+        columns['state'].append(encode(MARKET_STATES, market_state))
+        columns['type'].append(encode(RECORD_TYPES, record_type))
+        self.last_time[symbol] = record_time
+
+        return True
+
+    def flush(self):
+        """Append the buffered records to the column files."""
+        for symbol, columns in self.pending.items():
+            os.makedirs(os.path.join(self.directory, symbol), exist_ok=True)
+            for column, typecode in COLUMNS.items():
+                values = columns[column]
+                with open(self.get_column_filename(symbol, column),
+                          'ab') as fp:
+                    fp.write(struct.pack('{}{}'.format(len(values), typecode),
+                                         *values))
+        self.pending = {}
+
+    def close(self):
+        """Write out any buffered records."""
+        self.flush()
+
+    def open_series(self, symbol):
+        """Open a symbol's memory mapped columns for reading."""
+        return Series(self, symbol)
+
+
+class Series:
+    """Memory mapped, read only view of a symbol's columns."""
+
+    def __init__(self, store, symbol):
+        self.symbol = symbol
+        self.maps = []
+        self.columns = {}
+        for column, typecode in COLUMNS.items():
+            filename = store.get_column_filename(symbol, column)
+            view = memoryview(b'').cast(typecode)
+            try:
+                with open(filename, 'rb') as fp:
+                    size = os.fstat(fp.fileno()).st_size
+                    # leave out a value that is only partly written
+                    size -= size % struct.calcsize(typecode)
+                    if size:
+                        mapped = mmap.mmap(fp.fileno(), 0,
+                                           access=mmap.ACCESS_READ)
+                        self.maps.append(mapped)
+                        view = memoryview(mapped)[:size].cast(typecode)
+            except IOError:
+                pass
+            self.columns[column] = view
+
+        # A partially written record only counts once all columns have it
+        self.length = min(len(x) for x in self.columns.values())
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Release the memory maps."""
+        for view in self.columns.values():
+            view.release()
+        for mapped in self.maps:
+            mapped.close()
+        self.columns = {}
+        self.maps = []
+
+    def get_range(self, start=None, end=None):
+        """Get the (start, end) row indexes for records with
+           start <= time < end."""
+        times = self.columns['time']
+        lo = 0
+        hi = self.length
+        if start is not None:
+            lo = bisect.bisect_left(times, start, 0, self.length)
+        if end is not None:
+            hi = bisect.bisect_left(times, end, lo, self.length)
+
+        return lo, hi
+
+    def get_records(self, start=None, end=None):
+        """Get the records with start <= time < end as dicts."""
+        lo, hi = self.get_range(start, end)
+        columns = self.columns
+
+        return [
+            {
+                'time': columns['time'][i],
+                'price': columns['price'][i],
+                'change': columns['change'][i],
+                'percent': columns['percent'][i],
+                'market_state': decode(MARKET_STATES, columns['state'][i]),
+                'type': decode(RECORD_TYPES, columns['type'][i]),
+            }
+            for i in range(lo, hi)
+        ]
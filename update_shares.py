@@ -8,6 +8,8 @@ import json
 
 import colorama
 
+from shares_cache import load_json
+
 DEFAULT_SHARES_FILE=os.path.join(os.path.expanduser("~"), "pricer.json")
 HOLD_FIELD_COUNT=4
 DEFAULT_LIMIT=-1  # no limit
@@ -15,9 +17,19 @@ DEFAULT_LIMIT=-1  # no limit
 dt = datetime.datetime.today().strftime('%Y-%m-%d')
 
 quote_data_file = os.path.join(os.path.expanduser('~'), 'pricer_quotes.json')
+quotes_data = None
+
+
+def get_quotes_data():
+    """Get the saved quotes, only reading them the first time."""
+    global quotes_data
+
+    if quotes_data is None:
+        with open(quote_data_file) as fp:
+            quotes_data = json.load(fp)
+
+    return quotes_data
 
-with open(quote_data_file) as fp:
-    quotes_data = json.load(fp)
 
 def add(args):
     print("Adding a new position")
@@ -283,6 +295,7 @@ def show_open(args):
     if args.symbol:
         symbol_req = [x.upper() for x in args.symbol]
 
+    quotes_data = get_quotes_data()
     total_pl = 0.0
     for symbol, data in sorted(share_data['open'].items()):
         if not data:  # skip untracked symbold
@@ -343,11 +356,7 @@ def show_open(args):
 
 def get_share_data(filename):
     """Get the share information for the user."""
-    data = []
-    with open(filename) as fp:
-        data = json.load(fp)
-
-    return data
+    return load_json(filename)
 
 
 def set_share_data(filename, share_data):
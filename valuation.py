@@ -0,0 +1,129 @@
+"""Vectorized portfolio valuation.
+
+All lots of a portfolio are loaded once into contiguous arrays and then
+revalued against a vector of prices with a few numpy passes.
+"""
+import numpy as np
+
+
+def group_cumsum(values, group_start):
+    """Cumulative sum of values restarting at the start of every group.
+
+       group_start holds, for every row, the index of the first row of the
+       row's group.  Groups must be contiguous."""
+    cumsum = np.cumsum(values)
+    base = np.concatenate(([0.0], cumsum))[group_start]
+    return cumsum - base
+
+
+class Valuation:
+    """Per-lot, running and per-symbol values of a portfolio.
+
+       blocks is a list of (symbol, holdings) tuples as returned by
+       pricer.get_holding_blocks.  Every visible position of a holding, or
+       the holding itself if it has no positions, is a lot.  Lots without a
+       cost or share count are not valued.
+
+       block_rows[block][holding] is the list of the holding's lot rows in
+       display order, with None for lots that are not valued.  Running
+       values accumulate over the lots of a block."""
+
+    def __init__(self, blocks):
+        self.symbols = []
+        self.symbol_index = {}
+        self.block_rows = []
+
+        cost = []
+        shares = []
+        symbol_id = []
+        hold = []
+        group_start = []
+        for symbol, items in blocks:
+            if symbol not in self.symbol_index:
+                self.symbol_index[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            sid = self.symbol_index[symbol]
+            start = len(cost)
+
+            item_rows = []
+            for item in items:
+                positions = item.get('positions', [])
+                positions = [x for x in positions if not x.get('hide', False)]
+                if not positions:
+                    positions = [item]
+
+                rows = []
+                for position in positions:
+                    if (
+                        position.get('cost') is None or
+                        position.get('shares') is None
+                    ):
+                        rows.append(None)
+                        continue
+
+                    rows.append(len(cost))
+                    cost.append(position['cost'])
+                    shares.append(position['shares'])
+                    symbol_id.append(sid)
+                    hold.append(position.get('hold', False) or
+                                position.get('until') is not None)
+                    group_start.append(start)
+                item_rows.append(rows)
+            self.block_rows.append(item_rows)
+
+        self.cost = np.array(cost, dtype=np.float64)
+        self.shares = np.array(shares, dtype=np.float64)
+        self.symbol_id = np.array(symbol_id, dtype=np.intp)
+        self.hold = np.array(hold, dtype=bool)
+        self.group_start = np.array(group_start, dtype=np.intp)
+
+        # running cost basis and shares within each block
+        self.running_shares = group_cumsum(self.shares, self.group_start)
+        running_basis = group_cumsum(self.shares * self.cost,
+                                     self.group_start)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.running_avg = np.where(self.running_shares > 0,
+                                        running_basis / self.running_shares,
+                                        self.cost)
+
+        # per-symbol aggregates
+        count = len(self.symbols)
+        self.symbol_shares = np.bincount(self.symbol_id, self.shares,
+                                         minlength=count)
+        self.symbol_basis = np.bincount(self.symbol_id,
+                                        self.shares * self.cost,
+                                        minlength=count)
+        self.symbol_hold_shares = np.bincount(
+            self.symbol_id, self.shares * self.hold, minlength=count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.symbol_avg = self.symbol_basis / self.symbol_shares
+
+        self.prices = np.full(count, np.nan)
+        self.revalue_rows()
+
+    def set_prices(self, prices):
+        """Set the current prices from a dict of symbol -> price."""
+        for symbol, price in prices.items():
+            sid = self.symbol_index.get(symbol)
+            if sid is not None:
+                self.prices[sid] = price
+        self.revalue_rows()
+
+    def revalue_rows(self):
+        """Recompute all price dependent values."""
+        price = self.prices[self.symbol_id]
+
+        self.change = price - self.cost
+        self.gain = self.shares * self.change
+        self.running_change = price - self.running_avg
+        self.running_gain = self.running_shares * self.running_change
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.percent = self.change / self.cost * 100
+            self.running_percent = self.running_change / self.running_avg * 100
+
+        self.symbol_value = self.symbol_shares * self.prices
+        self.symbol_gain = self.symbol_value - self.symbol_basis
+
+        valued = ~np.isnan(self.prices)
+        self.total_value = self.symbol_value[valued].sum()
+        self.total_gain = self.symbol_gain[valued].sum()